@@ -1,13 +1,104 @@
-from ultralytics import YOLO
 from os.path import join as ospathjoin
+from os.path import exists as ospathexists
+from os.path import splitext as ospathsplitext
+from os.path import normpath as ospathnormpath
 from os import listdir as oslistdir
+from os import makedirs as osmakedirs
 from tkinter import messagebox
 from dialogs.infobox import InfoBox
-from dialogs.trainanimaldetector import AnimalDetectorTrainingDialog
+from animal_detector.detection_cache import DetectionCache
+from animal_detector.exported_model import ExportedModel
 from shutil import copy as shutilcopy
+from shutil import move as shutilmove
+from shutil import rmtree as shutilrmtree
+from PIL import Image
+from concurrent.futures import Future
+from time import perf_counter
+import random
+import threading
+import yaml
 import utils
 
 
+def decode_image(image_file, size=640):
+    """
+    Decodes a picture straight to about the resolution the detector works at. JPEGs are scaled down while they are decoded, which is much faster than decoding the full picture and resizing it
+
+    :param image_file: The path to the picture or a file object holding it
+    :type image_file: str or file-like object
+    :param size: The smallest width and height the decoded picture needs (Defaults to 640)
+    :type size: int
+
+    :returns: The decoded RGB picture, at least size x size unless the original is smaller. Keeps the EXIF data of the original
+    :rtype: PIL.Image.Image
+    """
+    with Image.open(image_file) as image:
+        image.draft("RGB", (size, size))
+        return image.convert("RGB")
+
+
+def record_training_start(trainer):
+    """
+    Marks when training started, to estimate how long is left. Runs in the training process
+
+    :param trainer: The ultralytics trainer running the training
+    :type trainer: ultralytics.engine.trainer.BaseTrainer
+    """
+    trainer.progressStartTime = perf_counter()
+
+
+def record_epoch_start(trainer):
+    """
+    Marks when an epoch started, to measure how fast pictures are trained on. Runs in the training process
+
+    :param trainer: The ultralytics trainer running the training
+    :type trainer: ultralytics.engine.trainer.BaseTrainer
+    """
+    trainer.progressEpochStartTime = perf_counter()
+
+
+def record_epoch_trained(trainer):
+    """
+    Measures how long the training part of an epoch took, before it is validated. Runs in the training process
+
+    :param trainer: The ultralytics trainer running the training
+    :type trainer: ultralytics.engine.trainer.BaseTrainer
+    """
+    trainer.progressEpochTrainTime = perf_counter() - trainer.progressEpochStartTime
+
+
+def report_epoch(trainer):
+    """
+    Reports the loss, accuracy and speed of an epoch once it is validated. Runs in the training process
+
+    :param trainer: The ultralytics trainer running the training
+    :type trainer: ultralytics.engine.trainer.BaseTrainer
+    """
+    epochsDone = trainer.epoch + 1
+    secondsPerEpoch = (perf_counter() - trainer.progressStartTime) / epochsDone
+    metrics = trainer.metrics or {}
+    utils.report_progress(
+        {
+            "Epoch": str(epochsDone) + "/" + str(trainer.epochs),
+            "Loss": float(trainer.tloss.sum()) if trainer.tloss is not None else None,
+            "mAP50": metrics.get("metrics/mAP50(B)"),
+            "mAP50-95": metrics.get("metrics/mAP50-95(B)"),
+            "Images/s": len(trainer.train_loader.dataset)
+            / trainer.progressEpochTrainTime,
+            "ETA (min)": secondsPerEpoch * (trainer.epochs - epochsDone) / 60,
+        }
+    )
+
+
+# The ultralytics events the progress of a detector training is reported from
+progressCallbacks = {
+    "on_train_start": record_training_start,
+    "on_train_epoch_start": record_epoch_start,
+    "on_train_epoch_end": record_epoch_trained,
+    "on_fit_epoch_end": report_epoch,
+}
+
+
 class HuntingAnimalDetector:
     """
     Class to handle the operations involved with detecting animals in a picture
@@ -18,17 +109,51 @@ class HuntingAnimalDetector:
     :type retrain: bool
     :param wait_while_training: Whether or not we are going to block until training is done or if we can continue to use the system while training is occuring
     :type wait_while_training: bool (Default to False)
+    :param cache_path: The path to a sqlite file to keep detection results in so pictures are only run through the model once (Defaults to None, which turns off caching)
+    :type cache_path: str or None
+    :param backend: The runtime to detect animals with ("torch", "onnx", "openvino" or "int8" for the quantized OpenVINO model). The trained model is exported to that format the first time it is needed, falling back to torch if that fails (Defaults to "torch")
+    :type backend: str
+    :param progress_cb: Callback that runs on the Tk loop with the progress of every epoch while the detector trains (Defaults to None)
+    :type progress_cb: Callable
+
+    .. note::
+
+       The ready future is finished with this detector once a model is loaded, or with the error if training failed. Use ready.add_done_callback to carry on once the detector can be used instead of waiting on isLoading
     """
 
-    def __init__(self, root_window, retrain=False, wait_while_training=False):
+    exportSuffixes = {
+        "onnx": ".onnx",
+        "openvino": "_openvino_model",
+        "int8": "_int8_openvino_model",
+    }  # What ultralytics adds to the name of the .pt file when exporting to each format
+
+    def __init__(
+        self,
+        root_window,
+        retrain=False,
+        wait_while_training=False,
+        cache_path=None,
+        backend="torch",
+        progress_cb=None,
+    ):
         self.root = root_window
+        self.progressCallback = progress_cb
         self.waitTrainingDone = wait_while_training
+        self.requestedBackend = backend
+        self.backend = "torch"
+        self.detectionCache = (
+            DetectionCache(cache_path) if cache_path is not None else None
+        )
+        self.modelHash = None
         self.logger = utils.setup_logger("AnimalDetector", "Animal Detector.log")
         self.logger.info("Detector Started")
         self.baseDirectory = utils.resource_path("", file_name=__file__)
         self.isLoading = False
+        self.ready = Future()
         self.numTrainingEpochs = 0
         self.trainingBatchSize = 0
+        self.numCalibrationImages = 300
+        self.imageSize = 640  # The resolution the model was trained and exported at
         if (
             len(
                 [
@@ -38,6 +163,9 @@ class HuntingAnimalDetector:
                 ]
             ) == 0 or retrain
         ):
+            # Only loaded to train or run the torch model since it pulls in torch
+            from ultralytics import YOLO
+
             self.modelPath = ospathjoin(self.baseDirectory, "yolov8n.pt")
             self.model = YOLO(self.modelPath)  # Create the model using the modelPath
             if not retrain:
@@ -52,6 +180,9 @@ class HuntingAnimalDetector:
                     self.infoBox.close_info_box()
                     raise Exception("No Model Loaded and Training Not Initiated")
             self.isLoading = True
+            # These run inside the training process and stream each epoch back to the app. They are plain functions so the model can still be sent to a spawned process
+            for event, callback in progressCallbacks.items():
+                self.model.add_callback(event, callback)
             try:
                 self.trainer = utils.ModelTrainer(
                     self.logger,
@@ -61,9 +192,13 @@ class HuntingAnimalDetector:
                     self.trainingKwargs,
                     self.model.train,
                     self.transfer_weights,
+                    self.root,
+                    self.training_progress,
                 )
+                self.trainer.done.add_done_callback(self.training_done)
             except Exception as e:
                 self.logger.error(e.args[0])
+                self.ready.set_exception(e)
         else:
             self.modelPath = ospathjoin(
                 self.baseDirectory,
@@ -74,12 +209,58 @@ class HuntingAnimalDetector:
                     if item.endswith(".pt")
                 ][0],
             )  # Grab the first file in the models folder (Could add that it looks for the latest file put in)
-            self.model = YOLO(self.modelPath)  # Create the model using the modelPath
+            if self.root is not None and self.needs_export():
+                # Exporting and quantizing can take minutes, so do it off the Tk loop
+                self.isLoading = True
+                self.infoBox = InfoBox(
+                    self.root,
+                    "Exporting",
+                    "Please wait while the animal detector is exported for the "
+                    + self.requestedBackend
+                    + " backend",
+                )
+                self.exportThread = threading.Thread(
+                    target=self.load_in_background,
+                    name="Animal Detector Export",
+                    daemon=True,
+                )
+                self.exportThread.start()
+            else:
+                self.load_inference_model()
+                self.ready.set_result(self)
+
+    def training_done(self, future):
+        """
+        Passes a training failure on to anything waiting for the detector to be ready. A successful training marks the detector ready in transfer_weights
+
+        :param future: The finished training of the model trainer
+        :type future: concurrent.futures.Future
+        """
+        if future.exception() is not None and not self.ready.done():
+            self.ready.set_exception(future.exception())
+
+    def training_progress(self, message: dict):
+        """
+        Shows the latest epoch in the training info box, and passes it on to the progress callback
+
+        :param message: The progress of the epoch, as sent by epoch_ended
+        :type message: dict
+        """
+        if hasattr(self, "infoBox"):
+            self.infoBox.set_message(
+                "Training the animal detector\n"
+                + utils.format_progress(message, "\n")
+            )
+        if self.progressCallback is not None:
+            self.progressCallback(message)
 
     def get_train_info(self):
         """
         Loads any images to train the model on
         """
+        # Only loaded for training since the dialog imports torch to list the GPUs
+        from dialogs.trainanimaldetector import AnimalDetectorTrainingDialog
+
         trainDialog = AnimalDetectorTrainingDialog(self.root)
         if trainDialog.result is None:
             self.logger.info("User cancelled the training of the animal detector")
@@ -124,7 +305,7 @@ class HuntingAnimalDetector:
                     self.baseDirectory, "Models/Detector Data/dataset/dataset.yaml"
                 )
             ),
-            "imgsz": 640,
+            "imgsz": self.imageSize,
             "task": "detect",
             "project": ospathjoin(self.baseDirectory, "Models/Detector Data/runs"),
             "epochs": self.numTrainingEpochs,
@@ -138,7 +319,7 @@ class HuntingAnimalDetector:
 
     def transfer_weights(self):
         """
-        Saves the trained model in a location for later use
+        Saves the trained model in a location for later use, and starts exporting it for the requested backend in the background. The detector is ready once that is done
         """
         src = ospathjoin(
             self.baseDirectory,
@@ -151,17 +332,260 @@ class HuntingAnimalDetector:
         self.modelPath = ospathjoin(
             self.baseDirectory,
             "Models",
-            oslistdir(ospathjoin(self.baseDirectory, "Models"))[0],
+            [
+                item
+                for item in oslistdir(ospathjoin(self.baseDirectory, "Models"))
+                if item.endswith(".pt")
+            ][0],
         )  # Grab the first file in the models folder (Could add that it looks for the latest file put in)
+        # Exporting and quantizing can take minutes, so do it off the Tk loop
+        self.exportThread = threading.Thread(
+            target=self.export_in_background,
+            args=(dest,),
+            name="Animal Detector Export",
+            daemon=True,
+        )
+        self.exportThread.start()
+
+    def export_in_background(self, model_path):
+        """
+        Exports the newly trained model for the requested backend and loads it, then finishes up on the Tk loop. Runs on its own thread and never touches any widgets
+
+        :param model_path: The path to the trained .pt file
+        :type model_path: str
+        """
+        self.export_model(model_path)
+        self.modelHash = None  # The model may have changed so any cached detections no longer apply
+        try:
+            self.load_inference_model()
+        except Exception as e:
+            self.logger.exception("Failed to load the trained model")
+            self.ready.set_exception(e)
+            return
+        if self.root is not None:
+            self.root.after_idle(self.training_finished)
+        else:
+            self.training_finished()
+
+    def training_finished(self):
+        """
+        Marks the detector ready and lets the user know the new model can be used
+        """
         self.isLoading = False
-        if hasattr(self,"infobox"):
+        self.ready.set_result(self)
+        if hasattr(self, "infoBox"):
             self.infoBox.close_info_box()
         messagebox.showinfo(
             "Detector Training Completed",
             "Animal detector model has finished training, you may use it to acess the hunt section",
         )
         self.logger.info("Transfered best training to be default model")
-        
+
+    def load_in_background(self):
+        """
+        Exports the existing model for the requested backend and loads it, then marks the detector ready on the Tk loop. Runs on its own thread and never touches any widgets
+        """
+        try:
+            self.load_inference_model()
+        except Exception as e:
+            self.logger.exception("Failed to load the animal detector")
+            self.ready.set_exception(e)
+            return
+        self.root.after_idle(self.export_finished)
+
+    def export_finished(self):
+        """
+        Marks the detector ready once the model has been exported and loaded
+        """
+        self.isLoading = False
+        self.ready.set_result(self)
+        self.infoBox.close_info_box()
+
+    def export_model(self, model_path):
+        """
+        Exports a trained model to ONNX, OpenVINO or a quantized INT8 model, whichever backend was requested, so it can be run on a faster CPU runtime. Nothing is exported for the torch backend
+
+        :param model_path: The path to the trained .pt file to export. The exported models are saved next to it
+        :type model_path: str
+        """
+        from ultralytics import YOLO
+
+        exportFormats = []
+        if self.requestedBackend in ("onnx", "openvino"):
+            exportFormats.append(self.requestedBackend)
+        for exportFormat in exportFormats:
+            try:
+                # Dynamic axes are needed so batches of any size can be sent through the exported model
+                YOLO(model_path).export(
+                    format=exportFormat, imgsz=self.imageSize, dynamic=True
+                )
+                self.logger.info("Exported " + model_path + " to " + exportFormat)
+            except Exception as e:
+                self.logger.error(
+                    "Failed to export "
+                    + model_path
+                    + " to "
+                    + exportFormat
+                    + ": "
+                    + str(e)
+                )
+        if self.requestedBackend == "int8":
+            try:
+                self.quantize_model(model_path)
+            except Exception as e:
+                self.logger.error("Failed to quantize " + model_path + ": " + str(e))
+
+    def quantize_model(self, model_path):
+        """
+        Makes an INT8 OpenVINO copy of a trained model, calibrated on a sample of the training images, and compares its accuracy against the original on the validation images
+
+        :param model_path: The path to the trained .pt file to quantize. The quantized model is saved next to it
+        :type model_path: str
+
+        :returns: The mAP50 of the original and the quantized model on the validation images
+        :rtype: dict{str: float}
+        """
+        from ultralytics import YOLO
+
+        datasetPath = ospathjoin(self.baseDirectory, "Models/Detector Data/dataset")
+        calibrationPath = ospathjoin(
+            self.baseDirectory, "Models/Detector Data/calibration"
+        )
+        if not ospathexists(calibrationPath):
+            osmakedirs(calibrationPath)
+        trainingImages = sorted(
+            oslistdir(ospathjoin(datasetPath, "training/images"))
+        )
+        calibrationImages = random.Random(0).sample(
+            trainingImages, min(self.numCalibrationImages, len(trainingImages))
+        )  # Seeded so retraining with the same images gives the same calibration set
+        with open(ospathjoin(calibrationPath, "calibration.txt"), "w") as listFile:
+            for image in calibrationImages:
+                listFile.write(
+                    ospathjoin(datasetPath, "training/images", image) + "\n"
+                )
+        with open(ospathjoin(datasetPath, "dataset.yaml")) as datasetFile:
+            datasetInfo = yaml.safe_load(datasetFile)
+        with open(ospathjoin(calibrationPath, "calibration.yaml"), "w") as yamlFile:
+            yaml.safe_dump(
+                {
+                    "path": calibrationPath,
+                    "train": "calibration.txt",
+                    "val": "calibration.txt",
+                    "nc": datasetInfo["nc"],
+                    "names": datasetInfo["names"],
+                },
+                yamlFile,
+            )
+
+        # The calibration images are read from the "val" entry of the data file
+        exportedPath = YOLO(model_path).export(
+            format="openvino",
+            imgsz=self.imageSize,
+            int8=True,
+            data=ospathjoin(calibrationPath, "calibration.yaml"),
+        )
+        exportedPath = str(exportedPath).rstrip("/\\")
+        quantizedPath = ospathsplitext(model_path)[0] + self.exportSuffixes["int8"]
+        if ospathnormpath(exportedPath) != ospathnormpath(quantizedPath):
+            if ospathexists(quantizedPath):
+                shutilrmtree(quantizedPath)
+            shutilmove(exportedPath, quantizedPath)
+
+        validationKwargs = {
+            "data": ospathjoin(datasetPath, "dataset.yaml"),
+            "imgsz": self.imageSize,
+            "split": "val",
+            "verbose": False,
+        }
+        accuracy = {
+            "FP32 mAP50": YOLO(model_path).val(**validationKwargs).box.map50,
+            "INT8 mAP50": YOLO(quantizedPath, task="detect")
+            .val(**validationKwargs)
+            .box.map50,
+        }
+        self.logger.info(
+            "Quantized "
+            + model_path
+            + " to INT8, validation mAP50 went from "
+            + str(round(accuracy["FP32 mAP50"], 4))
+            + " to "
+            + str(round(accuracy["INT8 mAP50"], 4))
+            + " (delta "
+            + str(round(accuracy["INT8 mAP50"] - accuracy["FP32 mAP50"], 4))
+            + ")"
+        )
+        return accuracy
+
+    def export_path(self):
+        """
+        Gets where the export of the current model for the requested backend is kept
+
+        :returns: The path to the exported model, or None for the torch backend
+        :rtype: str or None
+        """
+        if self.requestedBackend not in self.exportSuffixes:
+            return None
+        return (
+            ospathsplitext(self.modelPath)[0]
+            + self.exportSuffixes[self.requestedBackend]
+        )
+
+    def needs_export(self):
+        """
+        Checks if the current model still has to be exported for the requested backend
+
+        :returns: True if the requested backend has no export of the model yet
+        :rtype: bool
+        """
+        return self.export_path() is not None and not ospathexists(self.export_path())
+
+    def load_inference_model(self):
+        """
+        Loads the model used to detect animals with the requested backend, exporting it first if that hasn't been done yet. The exported models run through their own runtime without ultralytics or torch. Falls back to the torch model if the model can't be exported or loaded for that backend
+        """
+        self.backend = "torch"
+        if self.needs_export():
+            self.export_model(self.modelPath)
+        if self.export_path() is not None:
+            if ospathexists(self.export_path()):
+                try:
+                    self.model = ExportedModel(
+                        self.export_path(), self.requestedBackend, self.imageSize
+                    )
+                    self.backend = self.requestedBackend
+                except Exception as e:
+                    self.logger.error(
+                        "Failed to load "
+                        + self.export_path()
+                        + ", falling back to torch: "
+                        + str(e)
+                    )
+            else:
+                self.logger.warning(
+                    "No "
+                    + self.requestedBackend
+                    + " export of "
+                    + self.modelPath
+                    + ", falling back to torch"
+                )
+        if self.backend == "torch":
+            from ultralytics import YOLO
+
+            self.model = YOLO(self.modelPath, task="detect")
+        self.logger.info("Detecting animals with the " + self.backend + " backend")
+
+    def get_model_hash(self):
+        """
+        Gets the hash of the model file and backend currently being used. Only calculated the first time it is needed
+
+        :returns: The hex digest of the model file
+        :rtype: str
+        """
+        if self.modelHash is None:
+            # The backend is included since the exported models can give slightly different results
+            self.modelHash = utils.file_hash(self.modelPath) + ":" + self.backend
+        return self.modelHash
 
     def detect_animals(self, image_path, confidence_threshold):
         """
@@ -174,10 +598,139 @@ class HuntingAnimalDetector:
         :returns: A list of the classes seen in the picture
         :rtype: list[int] or None
         """
-        if not self.isLoading:
-            results = list(
-                self.model.predict(image_path, conf=confidence_threshold, verbose=False)
-            )[0].boxes.cls.tolist()
-            return [int(x) for x in results]
+        results = self.detect_animals_batch([image_path], confidence_threshold, 1)
+        return None if results is None else results[0]
+
+    def detect_animals_batch(self, image_paths, confidence_threshold, batch_size=16):
+        """
+        Predicts which animals are in each of a list of pictures, running the model on several pictures at a time
+
+        :param image_paths: The paths to the images to predict on
+        :type image_paths: list[str]
+        :param confidence_threshold: The threshold for saying we have the identified species in the image
+        :type confidence_threshold: float
+        :param batch_size: The number of images to send through the model at once (Defaults to 16)
+        :type batch_size: int
+        :returns: A list of the classes seen in each picture, in the same order as the input paths
+        :rtype: list[list[int]] or None
+        """
+        if self.isLoading:
+            return None
+        if self.detectionCache is None:
+            imageHashes = list(range(len(image_paths)))
         else:
+            imageHashes = [utils.file_hash(imagePath) for imagePath in image_paths]
+        return self.detect_with_cache(
+            image_paths, imageHashes, confidence_threshold, batch_size
+        )
+
+    def detect_animals_images(
+        self, images, image_hashes, confidence_threshold, batch_size=16
+    ):
+        """
+        Predicts which animals are in pictures that have already been decoded, so a caller that needs the pixels anyway doesn't decode them twice
+
+        :param images: The decoded pictures, ideally from decode_image
+        :type images: list[PIL.Image.Image]
+        :param image_hashes: The content hashes of the picture files, used to look up and save results in the detection cache
+        :type image_hashes: list[str]
+        :param confidence_threshold: The threshold for saying we have the identified species in the image
+        :type confidence_threshold: float
+        :param batch_size: The number of images to send through the model at once (Defaults to 16)
+        :type batch_size: int
+        :returns: A list of the classes seen in each picture, in the same order as the input images
+        :rtype: list[list[int]] or None
+        """
+        if self.isLoading:
             return None
+        return self.detect_with_cache(
+            images, image_hashes, confidence_threshold, batch_size
+        )
+
+    def detect_with_cache(self, images, image_hashes, confidence_threshold, batch_size):
+        """
+        Looks up the pictures in the detection cache and only runs the model on the ones it hasn't seen
+
+        :param images: The paths to the pictures or the decoded pictures
+        :type images: list[str or PIL.Image.Image]
+        :param image_hashes: The content hash of each picture
+        :type image_hashes: list[str]
+        :param confidence_threshold: The threshold for saying we have the identified species in the image
+        :type confidence_threshold: float
+        :param batch_size: The number of images to send through the model at once
+        :type batch_size: int
+        :returns: A list of the classes seen in each picture, in the same order as the input images
+        :rtype: list[list[int]]
+        """
+        if self.detectionCache is None:
+            cachedResults = {}
+        else:
+            cachedResults = self.detectionCache.get_many(
+                image_hashes, self.get_model_hash(), confidence_threshold
+            )
+        missedImages = {}
+        for image, imageHash in zip(images, image_hashes):
+            if imageHash not in cachedResults:
+                missedImages.update({imageHash: image})
+        if len(missedImages) > 0:
+            newResults = dict(
+                zip(
+                    missedImages.keys(),
+                    self.run_model(
+                        list(missedImages.values()), confidence_threshold, batch_size
+                    ),
+                )
+            )
+            if self.detectionCache is not None:
+                self.detectionCache.put_many(
+                    newResults, self.get_model_hash(), confidence_threshold
+                )
+            cachedResults.update(newResults)
+        self.logger.info(
+            "Detected animals in "
+            + str(len(image_hashes))
+            + " images, "
+            + str(len(missedImages))
+            + " needed the model"
+        )
+        return [cachedResults[imageHash]["classes"] for imageHash in image_hashes]
+
+    def run_model(self, images, confidence_threshold, batch_size):
+        """
+        Runs the model over the given images in batches
+
+        :param images: The paths to the images or the already decoded images to predict on
+        :type images: list[str or PIL.Image.Image]
+        :param confidence_threshold: The threshold for saying we have the identified species in the image
+        :type confidence_threshold: float
+        :param batch_size: The number of images to send through the model at once
+        :type batch_size: int
+        :returns: The classes, boxes (xyxy as a fraction of the picture size, so they don't depend on the resolution it was decoded at) and scores found in each picture, in the same order as the input
+        :rtype: list[dict]
+        """
+        detections = []
+        for batchStart in range(0, len(images), batch_size):
+            batchImages = [
+                (
+                    decode_image(image, self.imageSize)
+                    if isinstance(image, str)
+                    else image
+                )
+                for image in images[batchStart : batchStart + batch_size]
+            ]
+            if self.backend != "torch":
+                detections.extend(self.model.predict(batchImages, confidence_threshold))
+                continue
+            # Passing a list of decoded images makes the model letterbox and predict on them as a single batch
+            results = self.model.predict(
+                batchImages, conf=confidence_threshold, verbose=False
+            )
+            for result in results:
+                detections.append(
+                    {
+                        "classes": [int(x) for x in result.boxes.cls.tolist()],
+                        "boxes": result.boxes.xyxyn.tolist(),
+                        "scores": result.boxes.conf.tolist(),
+                    }
+                )
+        return detections
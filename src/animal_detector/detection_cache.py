@@ -0,0 +1,103 @@
+import sqlite3
+import json
+from contextlib import closing
+from os.path import dirname as ospathdirname
+from os.path import exists as ospathexists
+from os import makedirs as osmakedirs
+
+
+class DetectionCache:
+    """
+    Stores the results of the animal detector on disk so pictures that have already been looked at don't need to go through the model again
+
+    :param db_path: The path to the sqlite file to keep the results in (Usually in the property's db folder)
+    :type db_path: str
+
+    .. note::
+
+       Several ingestion processes may share the same file, so connections wait on each other's writes instead of failing
+
+    .. note::
+
+       Results are keyed by the hash of the image contents, the hash of the model file and the confidence threshold, so retraining the detector or renaming pictures never returns stale results
+    """
+
+    def __init__(self, db_path: str):
+        self.dbPath = db_path
+        self.lookupChunkSize = 500  # Hashes per lookup query, kept under SQLite's bound variable limit
+        if not ospathexists(ospathdirname(self.dbPath)):
+            osmakedirs(ospathdirname(self.dbPath))
+        with closing(sqlite3.connect(self.dbPath, timeout=30)) as connection:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS detections ("
+                    "image_hash TEXT, model_hash TEXT, confidence REAL, "
+                    "classes TEXT, boxes TEXT, scores TEXT, "
+                    "PRIMARY KEY (image_hash, model_hash, confidence))"
+                )
+
+    def get_many(self, image_hashes: list, model_hash: str, confidence: float):
+        """
+        Looks up any saved results for the given images
+
+        :param image_hashes: The content hashes of the images to look up
+        :type image_hashes: list[str]
+        :param model_hash: The hash of the model file that made the detections
+        :type model_hash: str
+        :param confidence: The confidence threshold the detections were made with
+        :type confidence: float
+
+        :returns: The saved results for any images that were found, keyed by the image hash
+        :rtype: dict{str: dict}
+        """
+        found = {}
+        uniqueHashes = list(set(image_hashes))
+        with closing(sqlite3.connect(self.dbPath, timeout=30)) as connection:
+            for start in range(0, len(uniqueHashes), self.lookupChunkSize):
+                hashChunk = uniqueHashes[start : start + self.lookupChunkSize]
+                rows = connection.execute(
+                    "SELECT image_hash, classes, boxes, scores FROM detections "
+                    "WHERE model_hash = ? AND confidence = ? AND image_hash IN ("
+                    + ", ".join("?" * len(hashChunk))
+                    + ")",
+                    [model_hash, confidence] + hashChunk,
+                ).fetchall()
+                found.update(
+                    {
+                        row[0]: {
+                            "classes": json.loads(row[1]),
+                            "boxes": json.loads(row[2]),
+                            "scores": json.loads(row[3]),
+                        }
+                        for row in rows
+                    }
+                )
+        return found
+
+    def put_many(self, results: dict, model_hash: str, confidence: float):
+        """
+        Saves detection results for later use
+
+        :param results: The results to save keyed by the image hash. Each result needs "classes", "boxes" and "scores" entries
+        :type results: dict{str: dict}
+        :param model_hash: The hash of the model file that made the detections
+        :type model_hash: str
+        :param confidence: The confidence threshold the detections were made with
+        :type confidence: float
+        """
+        with closing(sqlite3.connect(self.dbPath, timeout=30)) as connection:
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO detections VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            imageHash,
+                            model_hash,
+                            confidence,
+                            json.dumps(result["classes"]),
+                            json.dumps(result["boxes"]),
+                            json.dumps(result["scores"]),
+                        )
+                        for imageHash, result in results.items()
+                    ],
+                )
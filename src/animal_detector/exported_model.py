@@ -0,0 +1,219 @@
+from os.path import join as ospathjoin
+from os import listdir as oslistdir
+from PIL import Image
+import numpy
+
+
+class ExportedModel:
+    """
+    Runs an animal detector exported by ultralytics straight through ONNX Runtime or OpenVINO, so detecting animals doesn't need to load ultralytics or torch
+
+    :param model_path: The path to the exported .onnx file or OpenVINO model folder
+    :type model_path: str
+    :param backend: The runtime the model was exported for ("onnx", "openvino" or "int8")
+    :type backend: str
+    :param image_size: The resolution the model was exported at (Defaults to 640)
+    :type image_size: int
+    :param iou_threshold: How much two boxes of the same class can overlap before the less confident one is dropped (Defaults to 0.7, the same as ultralytics)
+    :type iou_threshold: float
+    :param max_detections: The most boxes kept for each picture (Defaults to 300, the same as ultralytics)
+    :type max_detections: int
+
+    .. note::
+
+       The pictures are letterboxed and the boxes suppressed the way ultralytics does it, so the results match the torch model up to rounding
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        backend: str,
+        image_size: int = 640,
+        iou_threshold: float = 0.7,
+        max_detections: int = 300,
+    ):
+        self.backend = backend
+        self.imageSize = image_size
+        self.iouThreshold = iou_threshold
+        self.maxDetections = max_detections
+        self.maxBoxSize = 7680  # Offsets each class's boxes so they never overlap another class's, as ultralytics does
+        if self.backend == "onnx":
+            import onnxruntime  # Optional dependency, only loaded for this backend
+
+            self.session = onnxruntime.InferenceSession(
+                model_path, providers=["CPUExecutionProvider"]
+            )
+            self.inputName = self.session.get_inputs()[0].name
+            batchDimension = self.session.get_inputs()[0].shape[0]
+            # Dynamic axes are named instead of sized
+            self.fixedBatchSize = (
+                batchDimension if isinstance(batchDimension, int) else None
+            )
+        else:
+            import openvino  # Optional dependency, only loaded for these backends
+
+            modelFile = [
+                item for item in oslistdir(model_path) if item.endswith(".xml")
+            ][0]
+            self.compiledModel = openvino.Core().compile_model(
+                ospathjoin(model_path, modelFile), "CPU"
+            )
+            batchDimension = self.compiledModel.input(0).get_partial_shape()[0]
+            self.fixedBatchSize = (
+                batchDimension.get_length() if batchDimension.is_static else None
+            )
+
+    def predict(self, images: list, confidence_threshold: float):
+        """
+        Finds the animals in a batch of pictures
+
+        :param images: The decoded RGB pictures to predict on
+        :type images: list[PIL.Image.Image]
+        :param confidence_threshold: The threshold for saying we have the identified species in the image
+        :type confidence_threshold: float
+
+        :returns: The classes, boxes (xyxy as a fraction of the picture size) and scores found in each picture, in the same order as the input
+        :rtype: list[dict]
+        """
+        letterboxed = [self.letterbox(image) for image in images]
+        batch = (
+            numpy.stack([pixels for pixels, _ in letterboxed])
+            .transpose(0, 3, 1, 2)
+            .astype(numpy.float32)
+            / 255
+        )
+        chunkSize = self.fixedBatchSize or len(batch)
+        outputs = []
+        for start in range(0, len(batch), chunkSize):
+            chunk = batch[start : start + chunkSize]
+            if len(chunk) < chunkSize:
+                # Models exported without dynamic axes only take full batches
+                chunk = numpy.concatenate(
+                    [
+                        chunk,
+                        numpy.zeros(
+                            (chunkSize - len(chunk),) + chunk.shape[1:], chunk.dtype
+                        ),
+                    ]
+                )
+            outputs.append(self.run_batch(numpy.ascontiguousarray(chunk)))
+        output = numpy.concatenate(outputs)[: len(batch)]
+        return [
+            self.postprocess(prediction, image.size, scaling, confidence_threshold)
+            for prediction, image, (_, scaling) in zip(output, images, letterboxed)
+        ]
+
+    def run_batch(self, batch):
+        """
+        Sends a batch of letterboxed pictures through the runtime
+
+        :param batch: The pictures as floats between 0 and 1, shaped (pictures, 3, size, size)
+        :type batch: numpy.ndarray
+
+        :returns: The raw output of the model, shaped (pictures, 4 + classes, anchors)
+        :rtype: numpy.ndarray
+        """
+        if self.backend == "onnx":
+            return self.session.run(None, {self.inputName: batch})[0]
+        return self.compiledModel([batch])[self.compiledModel.output(0)]
+
+    def letterbox(self, image):
+        """
+        Scales a picture to fit the model's input and pads the rest with gray, keeping its aspect ratio
+
+        :param image: The decoded RGB picture
+        :type image: PIL.Image.Image
+
+        :returns: The letterboxed pixels, and the scale and left and top padding used so the boxes can be mapped back onto the picture
+        :rtype: tuple(numpy.ndarray, tuple(float, int, int))
+        """
+        width, height = image.size
+        gain = min(self.imageSize / width, self.imageSize / height)
+        newWidth, newHeight = round(width * gain), round(height * gain)
+        padLeft = round((self.imageSize - newWidth) / 2 - 0.1)
+        padTop = round((self.imageSize - newHeight) / 2 - 0.1)
+        canvas = Image.new("RGB", (self.imageSize, self.imageSize), (114, 114, 114))
+        if (newWidth, newHeight) != (width, height):
+            image = image.resize((newWidth, newHeight), Image.BILINEAR)
+        canvas.paste(image, (padLeft, padTop))
+        return numpy.asarray(canvas), (gain, padLeft, padTop)
+
+    def postprocess(self, prediction, image_size, scaling, confidence_threshold):
+        """
+        Turns the raw output for one picture into its detections
+
+        :param prediction: The model output for the picture, shaped (4 + classes, anchors) with the boxes as center x, center y, width and height
+        :type prediction: numpy.ndarray
+        :param image_size: The width and height of the picture before it was letterboxed
+        :type image_size: tuple(int, int)
+        :param scaling: The scale and left and top padding from letterbox
+        :type scaling: tuple(float, int, int)
+        :param confidence_threshold: The threshold for saying we have the identified species in the image
+        :type confidence_threshold: float
+
+        :returns: The classes, boxes (xyxy as a fraction of the picture size) and scores found in the picture
+        :rtype: dict
+        """
+        prediction = prediction.T
+        classScores = prediction[:, 4:]
+        classes = classScores.argmax(1)
+        scores = classScores[numpy.arange(len(classes)), classes]
+        confident = scores > confidence_threshold
+        centers = prediction[confident, :4]
+        classes = classes[confident]
+        scores = scores[confident]
+        boxes = numpy.concatenate(
+            [
+                centers[:, :2] - centers[:, 2:] / 2,
+                centers[:, :2] + centers[:, 2:] / 2,
+            ],
+            axis=1,
+        )
+        kept = self.non_max_suppression(boxes, scores, classes)
+        boxes, scores, classes = boxes[kept], scores[kept], classes[kept]
+
+        gain, padLeft, padTop = scaling
+        width, height = image_size
+        boxes = (boxes - [padLeft, padTop, padLeft, padTop]) / gain
+        boxes = boxes.clip(0, [width, height, width, height])
+        return {
+            "classes": [int(x) for x in classes],
+            "boxes": (boxes / [width, height, width, height]).tolist(),
+            "scores": scores.tolist(),
+        }
+
+    def non_max_suppression(self, boxes, scores, classes):
+        """
+        Drops any box that overlaps a more confident box of the same class
+
+        :param boxes: The xyxy boxes in letterboxed pixels
+        :type boxes: numpy.ndarray
+        :param scores: The confidence of each box
+        :type scores: numpy.ndarray
+        :param classes: The class of each box
+        :type classes: numpy.ndarray
+
+        :returns: The indices of the boxes to keep, most confident first
+        :rtype: numpy.ndarray
+        """
+        offsetBoxes = boxes + classes[:, None] * self.maxBoxSize
+        areas = (offsetBoxes[:, 2] - offsetBoxes[:, 0]) * (
+            offsetBoxes[:, 3] - offsetBoxes[:, 1]
+        )
+        order = scores.argsort()[::-1]
+        kept = []
+        while len(order) > 0 and len(kept) < self.maxDetections:
+            best, rest = order[0], order[1:]
+            kept.append(best)
+            overlapWidth = (
+                numpy.minimum(offsetBoxes[best, 2], offsetBoxes[rest, 2])
+                - numpy.maximum(offsetBoxes[best, 0], offsetBoxes[rest, 0])
+            ).clip(0)
+            overlapHeight = (
+                numpy.minimum(offsetBoxes[best, 3], offsetBoxes[rest, 3])
+                - numpy.maximum(offsetBoxes[best, 1], offsetBoxes[rest, 1])
+            ).clip(0)
+            overlap = overlapWidth * overlapHeight
+            iou = overlap / (areas[best] + areas[rest] - overlap)
+            order = rest[iou <= self.iouThreshold]
+        return numpy.array(kept, dtype=int)
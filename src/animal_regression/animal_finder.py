@@ -1,21 +1,135 @@
-from sklearn.svm import OneClassSVM
-from sklearn.preprocessing import RobustScaler
-from sklearn.pipeline import make_pipeline
+from animal_regression.finder_estimators import make_estimator
+from animal_regression.finder_estimators import benchmark_estimators
 from weather.weather import Weather
 from os.path import join as ospathjoin
 from os.path import exists as ospathexists
+from os.path import getmtime as ospathgetmtime
+from os.path import basename as ospathbasename
 from os import listdir as oslistdir
 from os import mkdir as osmkdir
+from os import replace as osreplace
+from os import makedirs as osmakedirs
 from csv import reader as csvreader
 from exif import Image
 from datetime import datetime
 from datetime import timedelta
+from time import perf_counter
 from pandas import DataFrame
+from pandas import date_range
+from pandas import DatetimeIndex
+from pandas import Index
+from pandas import concat as pandasconcat
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
 import joblib
+import numpy
+import hashlib
+import json
+import pyarrow
+import pyarrow.parquet as pyarrowparquet
 import utils
-from timezonefinder.timezonefinder import TimezoneFinder
 import pytz
 
+workerDetector = None  # The detector each ingestion worker process loads once and reuses
+
+
+def read_image_datetime(image_path: str):
+    """
+    Reads the time a picture was taken from its EXIF data
+
+    :param image_path: The path to the picture
+    :type image_path: str
+
+    :returns: The time the picture was taken
+    :rtype: datetime.datetime
+    """
+    return datetime.strptime(
+        Image(image_path).datetime_original, "%Y:%m:%d %H:%M:%S"
+    )
+
+
+def haversine_matrix(coords_a, coords_b):
+    """
+    Calculates the distance between every pair of points in two lists of GPS coordinates
+
+    :param coords_a: The first list of coordinates
+    :type coords_a: list[tuple(lat, long)]
+    :param coords_b: The second list of coordinates
+    :type coords_b: list[tuple(lat, long)]
+
+    :returns: The distance in miles from each point in the first list (rows) to each point in the second list (columns)
+    :rtype: numpy.ndarray
+    """
+    pointsA = numpy.radians(numpy.asarray(coords_a, dtype=float).reshape(-1, 2))
+    pointsB = numpy.radians(numpy.asarray(coords_b, dtype=float).reshape(-1, 2))
+    latA = pointsA[:, 0][:, None]
+    latB = pointsB[:, 0][None, :]
+    halfChord = (
+        numpy.sin((latB - latA) / 2) ** 2
+        + numpy.cos(latA)
+        * numpy.cos(latB)
+        * numpy.sin((pointsB[:, 1][None, :] - pointsA[:, 1][:, None]) / 2) ** 2
+    )
+    return 2 * 3958.8 * numpy.arcsin(numpy.sqrt(halfChord))
+
+
+def init_ingest_worker(cache_path: str, backend: str):
+    """
+    Loads the animal detector model once when an ingestion worker process starts
+
+    :param cache_path: The path to the detection cache the workers share
+    :type cache_path: str
+    :param backend: The runtime the detector should use
+    :type backend: str
+    """
+    global workerDetector
+    from animal_detector.animal_detector import HuntingAnimalDetector
+
+    workerDetector = HuntingAnimalDetector(
+        None, cache_path=cache_path, backend=backend
+    )
+
+
+def ingest_image_chunk(
+    image_paths: list, confidence_threshold: float, batch_size: int
+):
+    """
+    Reads the capture times and detects the animals for a chunk of pictures inside an ingestion worker process
+
+    :param image_paths: The paths to the pictures to process
+    :type image_paths: list[str]
+    :param confidence_threshold: The threshold for saying we have the identified species in the image
+    :type confidence_threshold: float
+    :param batch_size: The number of images to send through the detector at once
+    :type batch_size: int
+
+    :returns: The capture times and the detected classes for each picture, in the same order as the input paths
+    :rtype: tuple(list[datetime.datetime], list[list[int]])
+    """
+    return (
+        [read_image_datetime(imagePath) for imagePath in image_paths],
+        workerDetector.detect_animals_batch(
+            image_paths, confidence_threshold, batch_size
+        ),
+    )
+
+
+def fit_camera_model(model, samples: list):
+    """
+    Fits the model of a single camera. Kept at the module level so it can be sent to the training worker processes
+
+    :param model: The untrained model for the camera
+    :type model: sklearn.pipeline.Pipeline
+    :param samples: The feature rows of the times the camera saw the desired species
+    :type samples: list[list[float]]
+
+    :returns: The trained model and how many seconds it took to fit
+    :rtype: tuple(sklearn.pipeline.Pipeline, float)
+    """
+    fitStart = perf_counter()
+    model.fit(samples)
+    return model, perf_counter() - fitStart
+
 
 class AnimalFinder:
     """
@@ -39,10 +153,20 @@ class AnimalFinder:
     :type first_week_day: str
     :param retrain: Whether to force a model retrain or not (Defaults to False)
     :type retrain: bool
+    :param ingest_workers: The number of processes to spread picture detection across when gathering training data. 1 keeps everything in this process (Defaults to 1)
+    :type ingest_workers: int
+    :param detector_backend: The runtime the animal detector should use ("torch", "onnx" or "openvino") (Defaults to "torch")
+    :type detector_backend: str
+    :param train_workers: The number of processes to train the camera models across. -1 uses every core (Defaults to 1)
+    :type train_workers: int
+    :param estimator: The model to use for each camera, one of the names in finder_estimators.finderEstimators. The choice is saved for the property, so None uses the property's last choice, or OneClassSVM for a new property (Defaults to None)
+    :type estimator: str
+    :param progress_cb: Callback that runs on the Tk loop with the progress of training, like how long each camera took to fit (Defaults to None)
+    :type progress_cb: Callable
 
     .. note::
 
-       The OneClassSVM model may not be the best model for this type of problem, especially as other variables are added.
+       The OneClassSVM model may not be the best model for this type of problem, especially as other variables are added. Faster models can be picked with the estimator parameter for properties with large camera histories.
 
     .. note::
 
@@ -61,6 +185,10 @@ class AnimalFinder:
 
     """
 
+    predictionCache = OrderedDict()  # Recent predictions shared by every finder, oldest first
+    predictionCacheSize = 32
+    modelFileHashes = {}  # The hash of each model file keyed by its path and modified time
+
     def __init__(
         self,
         root,
@@ -72,10 +200,16 @@ class AnimalFinder:
         desired_species: str = "Deer",
         first_week_day: str = "sunday",
         retrain: bool = False,
+        ingest_workers: int = 1,
+        detector_backend: str = "torch",
+        train_workers: int = 1,
+        estimator: str = None,
+        progress_cb=None,
     ):
         self.logger = utils.setup_logger("Finder", "Animal Finder.log")
         self.logger.info("Finder Started")
         self.rootWindow = root
+        self.progressCallback = progress_cb
         self.dataDirectory = data_directory
         self.modelsFolderPath = utils.resource_path(
             "Models/Finder Models", file_name=__file__
@@ -83,25 +217,91 @@ class AnimalFinder:
         self.propertyCenter = property_center
         self.database = db_name
         self.detectorThreshold = 0.5
+        self.detectorBatchSize = 16
+        self.ingestWorkers = ingest_workers
+        self.detectorBackend = detector_backend
+        self.trainWorkers = train_workers
+        self.ingestChunkSize = 256  # Number of pictures handed to a worker process at a time
+        self.rankingDistanceScale = 0.25  # Miles over which a camera's influence on a stand falls off by a factor of e
+        self.rankingCutoff = 10  # Number of falloff distances past which a camera doesn't count towards a stand at all
         self.isLoading = False
         self.weatherFields = weather_fields
         self.firstWeekDay = first_week_day
         self.fields = ["Day of Year", "Time of Day", "Weekday", *self.weatherFields]
         self.speciesClasses = species_classes
         self.desiredSpecies = desired_species
-        self.timezoneStr = TimezoneFinder().timezone_at(
-            lat=property_center[0], lng=property_center[1]
+        self.timezoneStr = utils.property_timezone(
+            property_center,
+            ospathjoin(self.dataDirectory, self.database, "db", "timezone.txt"),
         )
         self.timeZone = pytz.timezone(self.timezoneStr)
         self.newWeather = Weather(
             property_center
         )  # Always train in imperial units no matter what
+        self.markersPath = ospathjoin(
+            self.dataDirectory, self.database, "db", "markers.csv"
+        )
+        self.markersTime = None
+        self.estimator = self.property_estimator(estimator)
+        self.modelsDict = {}
+        self.modelInfo = {}  # The features, training time and data fingerprint saved with the models
+        self.bundleTime = None  # The modified time of the model bundle when it was last read
+        self.modelCompression = 3  # Set to 0 to memory map the models instead of decompressing them
+
+        self.featuresFolder = ospathjoin(
+            self.dataDirectory, self.database, "db", "finder features"
+        )
+        self.featureImages = {}  # The pictures in each camera's feature store, keyed by camera with the store's modified time
+        self.checkedFolders = {}  # The modified times of each camera's folder and store when they last matched
+        self.fullRetrain = False
+        self.rebuildFeatures = False
+        self.load_markers()
+
+        if retrain:  # Start over, including running every picture through the detector again
+            self.start_training(full=True, rebuild=True)
+        elif not self.saved_models_exist():  # We need to train a new model
+            self.start_training(full=True)
+        elif len(self.stale_cameras()) > 0:  # Only the cameras with new pictures need training
+            self.start_training()
+
+    def start_training(self, full: bool = False, rebuild: bool = False):
+        """
+        Starts training the camera models in the background. Pictures already in the feature store are read from it instead of going through the detector again
+
+        :param full: Whether to refit the model of every camera, or only the cameras whose pictures changed (Defaults to False)
+        :type full: bool
+        :param rebuild: Whether to throw away the feature store and process every picture again (Defaults to False)
+        :type rebuild: bool
+        """
+        self.fullRetrain = full
+        self.rebuildFeatures = rebuild
+        if full:
+            self.modelsDict = {}
+        self.isLoading = True
+        self.trainer = utils.ModelTrainer(
+            self.logger,
+            "Animal Finder",
+            self.load_required_modules,
+            self.load_training_data,
+            None,
+            self.train,
+            self.finish_training,
+            self.rootWindow,
+            self.progressCallback,
+        )
+        self.trainer.done.add_done_callback(self.training_done)
+
+    def load_markers(self):
+        """
+        Reads the cameras and stands from the markers file. Does nothing if the file hasn't changed since it was last read
+        """
+        markersTime = ospathgetmtime(self.markersPath)
+        if markersTime == self.markersTime:
+            return
         # Generate the dictionary of all camera locations in the database including any abandoned images
         self.camerasDict = {}
-        self.modelsDict = {}
-        with open(
-            ospathjoin(self.dataDirectory, self.database, "db", "markers.csv"), "r"
-        ) as markercsv:
+        self.standsDict = {}
+        with open(self.markersPath, "r") as markercsv:
             reader = csvreader(markercsv)
             for line in reader:
                 if not line == []:  # If the line is not blank
@@ -109,47 +309,223 @@ class AnimalFinder:
                         self.camerasDict.update(
                             {line[2]: (line[0], line[1])}
                         )  # Update the stand dictionary with the name and a tuple of the gps coordinates
-        self.modelsDict = {}.fromkeys(self.camerasDict.keys())
+                    elif line[3] == "Stand" or line[3] == "Point of Interest":
+                        self.standsDict.update(
+                            {line[2]: (float(line[0]), float(line[1]))}
+                        )
+        self.markersTime = markersTime
 
-        if not self.load_model() or retrain:  # We need to train a new model
-            self.modelsDict = {}.fromkeys(self.camerasDict.keys())
-            for camera in self.modelsDict.keys():
-                self.modelsDict.update(
-                    {camera: make_pipeline(RobustScaler(), OneClassSVM())}
-                )
-            self.isLoading = True
-            self.trainer = utils.ModelTrainer(
-                self.logger,
-                "Animal Finder",
-                self.load_required_modules,
-                self.load_training_data,
-                None,
-                self.train,
-                self.save_models,
+    def property_estimator(self, estimator: str = None):
+        """
+        Gets the model to use for the cameras on this property, saving the choice if a new one is given
+
+        :param estimator: The newly chosen estimator, or None to use the saved one
+        :type estimator: str
+
+        :returns: The name of the estimator to use
+        :rtype: str
+        """
+        estimatorPath = ospathjoin(
+            self.dataDirectory, self.database, "db", "estimator.txt"
+        )
+        if estimator is not None:
+            make_estimator(estimator)  # Check the name before saving it
+            with open(estimatorPath, "w") as estimatorFile:
+                estimatorFile.write(estimator)
+            return estimator
+        if ospathexists(estimatorPath):
+            with open(estimatorPath, "r") as estimatorFile:
+                estimator = estimatorFile.read().strip()
+            if estimator != "":
+                return estimator
+        return "OneClassSVM"
+
+    def bundle_path(self):
+        """
+        Gets the path the models for this property and species are saved at
+
+        :returns: The path to the model bundle
+        :rtype: str
+        """
+        return ospathjoin(
+            self.modelsFolderPath, self.database + " " + self.desiredSpecies + ".joblib"
+        )
+
+    def load_bundle(self):
+        """
+        Loads the models of every camera from the bundle in a single read. Nothing is read if the bundle hasn't changed since it was last loaded
+
+        :returns: Whether there is a saved bundle or not
+        :rtype: bool
+        """
+        bundlePath = self.bundle_path()
+        if not ospathexists(bundlePath):
+            return False
+        bundleTime = ospathgetmtime(bundlePath)
+        if bundleTime != self.bundleTime:
+            self.logger.info("Loading the finder models from " + bundlePath)
+            # Compressed bundles can't be memory mapped, they have to be decompressed into memory
+            bundle = joblib.load(
+                bundlePath, mmap_mode=None if self.modelCompression else "r"
             )
+            self.modelsDict = bundle["Models"]
+            self.modelInfo = {
+                key: value for key, value in bundle.items() if key != "Models"
+            }
+            self.bundleTime = bundleTime
+        return True
 
-    def load_model(self):
+    def saved_models_exist(self):
         """
-        Tries to load the model from the disk.
+        Checks that every camera has a saved model that was trained on the current features
 
-        :returns: Whether the model loaded correctly or not
+        :returns: Whether every camera has a usable model on disk or not
         :rtype: bool
         """
         try:
-            for camera in self.camerasDict.keys():
-                self.modelsDict[camera] = joblib.load(
-                    self.modelsDict[camera],
-                    open(
-                        ospathjoin(
-                            self.modelsFolderPath,
-                            camera + " " + self.desiredSpecies + ".pkl",
-                        ),
-                        "rb",
-                    ),
-                )
+            if not self.load_bundle():
+                return False
         except Exception:
+            self.logger.exception("Could not load the finder models")
             return False
-        return True
+        return (
+            self.modelInfo.get("Features") == self.fields
+            and self.modelInfo.get("Estimator", "OneClassSVM") == self.estimator
+        )
+
+    def stale_cameras(self):
+        """
+        Finds the cameras whose models are out of date, because the camera is new or its pictures have changed since the model was trained
+
+        :returns: The names of the cameras that need training
+        :rtype: list[str]
+        """
+        self.load_markers()
+        staleCameras = []
+        for camera in self.camerasDict.keys():
+            # Cameras without any sightings are left out of the bundle, but still count as trained
+            if camera not in self.modelInfo.get("Cameras", self.modelsDict):
+                staleCameras.append(camera)
+                continue
+            cameraFolder = ospathjoin(
+                self.dataDirectory, self.database, "pictures", camera
+            )
+            folderTime = (
+                ospathgetmtime(cameraFolder) if ospathexists(cameraFolder) else None
+            )
+            checkedTimes = (folderTime, self.feature_store_time(camera))
+            if self.checkedFolders.get(camera) == checkedTimes:
+                continue  # Nothing was added or removed since the folder last matched
+            imageNames = oslistdir(cameraFolder) if folderTime is not None else []
+            if set(imageNames) != self.stored_images(camera):
+                staleCameras.append(camera)
+            else:
+                self.checkedFolders.update({camera: checkedTimes})
+        return staleCameras
+
+    def feature_store_time(self, camera: str):
+        """
+        Gets the modified time of a camera's feature store
+
+        :param camera: The name of the camera
+        :type camera: str
+
+        :returns: The modified time, or None if nothing was saved for the camera
+        :rtype: float or None
+        """
+        featuresPath = ospathjoin(self.featuresFolder, camera + ".parquet")
+        return ospathgetmtime(featuresPath) if ospathexists(featuresPath) else None
+
+    def stored_images(self, camera: str):
+        """
+        Gets the pictures saved in a camera's feature store. Kept in memory after the store is loaded or saved, and only read again if the file changed
+
+        :param camera: The name of the camera
+        :type camera: str
+
+        :returns: The file names of the pictures in the store
+        :rtype: set[str]
+        """
+        storeTime = self.feature_store_time(camera)
+        if (
+            camera not in self.featureImages
+            or self.featureImages[camera][0] != storeTime
+        ):
+            self.load_camera_features(camera)
+        return self.featureImages[camera][1]
+
+    def feature_columns(self):
+        """
+        Gets the columns saved in the feature store for each picture, the model features followed by how many of each species were seen
+
+        :returns: The names of the columns
+        :rtype: list[str]
+        """
+        return [*self.fields, *[species + " Count" for species in self.speciesClasses]]
+
+    def load_camera_features(self, camera: str):
+        """
+        Loads the feature rows saved for a camera by earlier trainings from the feature store
+
+        :param camera: The name of the camera
+        :type camera: str
+
+        :returns: One row per picture already used, indexed by the picture's file name. Empty if nothing was saved or it was built with different features
+        :rtype: pandas.DataFrame
+        """
+        featuresPath = ospathjoin(self.featuresFolder, camera + ".parquet")
+        if ospathexists(featuresPath):
+            table = pyarrowparquet.read_table(featuresPath)
+            firstWeekDay = (table.schema.metadata or {}).get(b"first_week_day", b"")
+            if (
+                table.column_names == ["Image", *self.feature_columns()]
+                and firstWeekDay.decode() == self.firstWeekDay
+            ):
+                features = table.to_pandas().set_index("Image")
+                self.featureImages.update(
+                    {camera: (ospathgetmtime(featuresPath), set(features.index))}
+                )
+                return features
+        self.featureImages.update(
+            {camera: (self.feature_store_time(camera), set())}
+        )
+        return self.empty_camera_features()
+
+    def empty_camera_features(self):
+        """
+        Makes the features of a camera that has no pictures used yet
+
+        :returns: The feature store columns with no rows
+        :rtype: pandas.DataFrame
+        """
+        return DataFrame(
+            columns=self.feature_columns(), index=Index([], name="Image"), dtype=float
+        )
+
+    def save_camera_features(self, camera: str, features):
+        """
+        Saves the feature rows of a camera to the feature store so later trainings only need to process new pictures
+
+        :param camera: The name of the camera
+        :type camera: str
+        :param features: The features to save, as returned by load_camera_features
+        :type features: pandas.DataFrame
+        """
+        if not ospathexists(self.featuresFolder):
+            osmakedirs(self.featuresFolder)
+        featuresPath = ospathjoin(self.featuresFolder, camera + ".parquet")
+        table = pyarrow.Table.from_pandas(features.reset_index(), preserve_index=False)
+        table = table.replace_schema_metadata(
+            {
+                **(table.schema.metadata or {}),
+                b"first_week_day": self.firstWeekDay.encode(),
+            }
+        )
+        pyarrowparquet.write_table(table, featuresPath + ".tmp")
+        osreplace(featuresPath + ".tmp", featuresPath)
+        self.featureImages.update(
+            {camera: (ospathgetmtime(featuresPath), set(features.index))}
+        )
 
     def load_required_modules(self):
         """
@@ -161,110 +537,374 @@ class AnimalFinder:
         from animal_detector.animal_detector import HuntingAnimalDetector
 
         try:
-            self.detector = HuntingAnimalDetector(self.rootWindow)
+            self.detector = HuntingAnimalDetector(
+                self.rootWindow,
+                cache_path=ospathjoin(
+                    self.dataDirectory, self.database, "db", "detections.db"
+                ),
+                backend=self.detectorBackend,
+                progress_cb=self.progressCallback,
+            )
         except Exception:
             return None
         return [self.detector]
 
     def load_training_data(self):
         """
-        Loads in any training data the model will need
+        Loads in any training data the model will need. Pictures that were used in an earlier training are read from the feature store instead of going through the detector again, unless the store is being rebuilt
         """
         self.trainingData = {}
+        self.changedCameras = []
 
         self.imagesPath = ospathjoin(self.dataDirectory, self.database, "pictures")
-        
+
+        cameraFeatures = {}
+        cameraImagePaths = {}
         oldestDate = datetime.now()
-        #Look for the oldest date in the pictures, but don't include the abandoned folder
-        for location in [folder for folder in oslistdir(self.imagesPath) if not "abandonded" in folder]:
-            for imagePath in oslistdir(ospathjoin(self.imagesPath,location)):
-                imageDate = datetime.strptime(imagePath.split(".")[0],"%Y_%m_%d_%H_%M_%S")
-                if imageDate < oldestDate:
-                    oldestDate = imageDate                    
-
-        oldestDate = oldestDate.replace(hour=0, minute=0, second=0, microsecond=0)
-        self.oldWeatherData = Weather(
-            self.propertyCenter,
-        )  # The weather models have a spatial resolution of about 1km. Most properties will be less than that.
-        # Also the weather across a couple km probably won't change that much unless you have very moutaineous terrain.
-        # This system assumes the weather is the same for the entire property.
-        # ANy differences
-        # The old weather is only able to get data from 5 days prior, so any pictures earlier than that will not have data
-        self.oldWeatherData.get_forecast(
-            oldestDate,
-            datetime.now(),
-            self.timezoneStr,
-            self.weatherFields,
-        )
+        # Abandoned pictures don't belong to a camera, so they are never used
         for location in oslistdir(self.imagesPath):
             if not location in self.camerasDict.keys():
                 continue
-            trainData = []
-            countData = []
-            for file in oslistdir(ospathjoin(self.imagesPath, location)):
-                imageFile = Image(ospathjoin(self.imagesPath, location, file))
-                imageDateTime = datetime.strptime(
-                    imageFile.datetime_original, "%Y:%m:%d %H:%M:%S"
-                )
-                animalCount = self.detector.detect_animals(
-                    ospathjoin(self.imagesPath, location, file), self.detectorThreshold
+            if self.rebuildFeatures:
+                features = self.empty_camera_features()
+            else:
+                features = self.load_camera_features(location)
+            imageNames = oslistdir(ospathjoin(self.imagesPath, location))
+            # Forget any pictures that have been removed from the camera since the last training
+            keptFeatures = features[features.index.isin(imageNames)]
+            removedCount = len(features) - len(keptFeatures)
+            features = keptFeatures
+            usedImages = set(features.index)
+            newImages = [
+                imageName for imageName in imageNames if imageName not in usedImages
+            ]
+            cameraFeatures.update({location: features})
+            if (
+                newImages == []
+                and removedCount == 0
+                and not self.fullRetrain
+                and location in self.modelInfo.get("Cameras", [])
+            ):
+                continue
+            self.changedCameras.append(location)
+            cameraImagePaths.update(
+                {
+                    location: [
+                        ospathjoin(self.imagesPath, location, imageName)
+                        for imageName in newImages
+                    ]
+                }
+            )
+            for imageName in newImages:
+                # Pictures taken in the same second have a number after the time
+                imageDate = datetime.strptime(imageName[:19], "%Y_%m_%d_%H_%M_%S")
+                if imageDate < oldestDate:
+                    oldestDate = imageDate
+        self.logger.info(
+            "Adding "
+            + str(sum(len(imagePaths) for imagePaths in cameraImagePaths.values()))
+            + " new pictures from "
+            + str(len(self.changedCameras))
+            + " cameras"
+        )
+
+        if any(len(imagePaths) > 0 for imagePaths in cameraImagePaths.values()):
+            oldestDate = oldestDate.replace(hour=0, minute=0, second=0, microsecond=0)
+            self.oldWeatherData = Weather(
+                self.propertyCenter,
+            )  # The weather models have a spatial resolution of about 1km. Most properties will be less than that.
+            # Also the weather across a couple km probably won't change that much unless you have very moutaineous terrain.
+            # This system assumes the weather is the same for the entire property.
+            # ANy differences
+            # The old weather is only able to get data from 5 days prior, so any pictures earlier than that will not have data
+            self.oldWeatherData.get_forecast(
+                oldestDate,
+                datetime.now(),
+                self.timezoneStr,
+                self.weatherFields,
+            )
+        for location, imageDateTimes, detections in self.ingest_camera_images(
+            cameraImagePaths
+        ):
+            if len(detections) > 0:
+                imageTimes = DatetimeIndex(imageDateTimes)
+                newFeatures = DataFrame(
+                    numpy.column_stack(
+                        [
+                            self.time_features(imageTimes),
+                            self.oldWeatherData.get_data_many(
+                                imageTimes, self.weatherFields
+                            ).to_numpy(dtype=float),
+                        ]
+                    ),
+                    columns=self.fields,
+                    index=Index(
+                        [
+                            ospathbasename(imagePath)
+                            for imagePath in cameraImagePaths[location]
+                        ],
+                        name="Image",
+                    ),
                 )
-                if self.firstWeekDay == "sunday":
-                    weekDay = (imageDateTime.weekday() + 1) % 6
+                # Keep the counts of every species so training for another one doesn't need the detector
+                for species, speciesClass in self.speciesClasses.items():
+                    newFeatures[species + " Count"] = [
+                        animalCount.count(speciesClass) for animalCount in detections
+                    ]
+                if len(cameraFeatures[location]) == 0:
+                    cameraFeatures[location] = newFeatures
                 else:
-                    weekDay = imageDateTime.weekday()
-                minuteOfDay = (
-                    imageDateTime.hour * 60 + imageDateTime.minute
-                )  # Get the time of the day for the image
-                numDayOfYear = imageDateTime.timetuple().tm_yday
-                imageWeatherData = self.oldWeatherData.get_data(
-                    imageDateTime, self.weatherFields
-                )
-                trainData.append(
-                    [numDayOfYear, minuteOfDay, weekDay, *imageWeatherData]
+                    cameraFeatures[location] = pandasconcat(
+                        [cameraFeatures[location], newFeatures]
+                    )
+            self.save_camera_features(location, cameraFeatures[location])
+
+        for location, features in cameraFeatures.items():
+            self.trainingData.update(
+                {
+                    location: [
+                        features[self.fields].to_numpy(dtype=float).tolist(),
+                        features[self.desiredSpecies + " Count"].astype(int).tolist(),
+                    ]
+                }
+            )
+
+    def ingest_camera_images(self, camera_image_paths: dict):
+        """
+        Reads the capture time and detects the animals in every picture of each camera. When more than one ingest worker is set, the pictures are split into chunks and spread across a process pool
+
+        :param camera_image_paths: The paths to the pictures for each camera
+        :type camera_image_paths: dict{str: list[str]}
+
+        :returns: The camera name, picture capture times and detected classes, one camera at a time as they finish
+        :rtype: Generator[tuple(str, list[datetime.datetime], list[list[int]])]
+        """
+        if self.ingestWorkers <= 1:
+            for location, imagePaths in camera_image_paths.items():
+                yield (
+                    location,
+                    [read_image_datetime(imagePath) for imagePath in imagePaths],
+                    self.detector.detect_animals_batch(
+                        imagePaths, self.detectorThreshold, self.detectorBatchSize
+                    ),
                 )
-                countData.append(
-                    animalCount.count(self.speciesClasses[self.desiredSpecies])
+            return
+
+        self.logger.info(
+            "Ingesting pictures with " + str(self.ingestWorkers) + " worker processes"
+        )
+        with ProcessPoolExecutor(
+            max_workers=self.ingestWorkers,
+            initializer=init_ingest_worker,
+            initargs=(self.detector.detectionCache.dbPath, self.detectorBackend),
+        ) as executor:
+            # Queue every chunk up front so the workers stay busy while earlier cameras are collected
+            cameraFutures = {}
+            for location, imagePaths in camera_image_paths.items():
+                cameraFutures.update(
+                    {
+                        location: [
+                            executor.submit(
+                                ingest_image_chunk,
+                                imagePaths[
+                                    chunkStart : chunkStart + self.ingestChunkSize
+                                ],
+                                self.detectorThreshold,
+                                self.detectorBatchSize,
+                            )
+                            for chunkStart in range(
+                                0, len(imagePaths), self.ingestChunkSize
+                            )
+                        ]
+                    }
                 )
-            self.trainingData.update({location: [trainData, countData]})
+            for location, futures in cameraFutures.items():
+                imageDateTimes = []
+                detections = []
+                for future in futures:
+                    chunkDateTimes, chunkDetections = future.result()
+                    imageDateTimes.extend(chunkDateTimes)
+                    detections.extend(chunkDetections)
+                yield location, imageDateTimes, detections
 
     def train(self):
         """
-        Trains the model
+        Trains the model of every camera whose training data changed, spread across the training workers, and saves them. Runs in the training process, so the models have to be saved here to get back to the app
         """
-        for camera in self.modelsDict.keys():
+        cameraSamples = {}
+        for camera in self.camerasDict.keys():
+            if camera in self.modelsDict and camera not in self.changedCameras:
+                continue  # The saved model is still up to date
+            self.modelsDict.pop(camera, None)
+            trainData, countData = self.trainingData.get(camera, [[], []])
             samples = [
-                sample
-                for sample, count in zip(
-                    self.trainingData[camera][0], self.trainingData[camera][1]
-                )
-                if count > 0
+                sample for sample, count in zip(trainData, countData) if count > 0
             ]
             if samples == []:
-                print(
-                    "Cannot train model due to no observational training data, retrain the animal detector model with better data or more epochs"
+                self.logger.warning(
+                    "Cannot train the model for "
+                    + camera
+                    + " due to no observational training data, retrain the animal detector model with better data or more epochs"
+                )
+                continue
+            cameraSamples.update({camera: samples})
+        if cameraSamples == {} and self.modelsDict == {}:
+            self.logger.error("No camera has observational training data")
+            return
+        self.logger.info(
+            "Training "
+            + str(len(cameraSamples))
+            + " camera models with "
+            + str(self.trainWorkers)
+            + " workers"
+        )
+        # The largest cameras take the longest, so start them first to keep every worker busy
+        trainOrder = sorted(
+            cameraSamples.keys(),
+            key=lambda camera: len(cameraSamples[camera]),
+            reverse=True,
+        )
+        models = [make_estimator(self.estimator) for camera in trainOrder]
+        samples = [cameraSamples[camera] for camera in trainOrder]
+        if self.trainWorkers == 1:
+            trainedModels = self.collect_fits(
+                trainOrder, samples, map(fit_camera_model, models, samples)
+            )
+        else:
+            # The pool is shut down on leaving the block, so it never keeps this process from exiting
+            with ProcessPoolExecutor(
+                max_workers=None if self.trainWorkers < 1 else self.trainWorkers
+            ) as executor:
+                trainedModels = self.collect_fits(
+                    trainOrder, samples, executor.map(fit_camera_model, models, samples)
                 )
-                return
-            self.modelsDict[camera].fit(samples)
+        # Put the models back in camera order
+        self.modelsDict = {
+            camera: trainedModels.get(camera, self.modelsDict.get(camera))
+            for camera in self.camerasDict.keys()
+            if camera in trainedModels or camera in self.modelsDict
+        }
+        self.save_models()
+
+    def collect_fits(self, cameras: list, samples: list, fit_results):
+        """
+        Collects the camera models as they finish fitting and reports how long each one took
+
+        :param cameras: The names of the cameras, in the order they were fit
+        :type cameras: list[str]
+        :param samples: The samples each camera was fit on, in the same order
+        :type samples: list[list[list[float]]]
+        :param fit_results: The model and fit time of each camera as they finish, in the same order
+        :type fit_results: Iterator[tuple(sklearn.pipeline.Pipeline, float)]
+
+        :returns: The trained models keyed by camera
+        :rtype: dict{str: sklearn.pipeline.Pipeline}
+        """
+        trainedModels = {}
+        for cameraNumber, (camera, cameraSamples, (model, fitTime)) in enumerate(
+            zip(cameras, samples, fit_results), start=1
+        ):
+            trainedModels.update({camera: model})
+            utils.report_progress(
+                {
+                    "Camera": camera,
+                    "Samples": len(cameraSamples),
+                    "Fit Time (s)": fitTime,
+                    "Cameras Trained": str(cameraNumber) + "/" + str(len(cameras)),
+                }
+            )
+        return trainedModels
 
     def save_models(self):
         """
-        Saves the model to disk after training
+        Saves the models of every camera to disk after training, bundled into a single file along with what they were trained on
+        """
+        if not ospathexists(self.modelsFolderPath):
+            osmkdir(self.modelsFolderPath)
+        bundle = {
+            "Models": self.modelsDict,
+            "Cameras": list(self.camerasDict.keys()),
+            "Estimator": self.estimator,
+            "Features": self.fields,
+            "First Week Day": self.firstWeekDay,
+            "Trained": datetime.now().isoformat(),
+            "Data Fingerprint": self.data_fingerprint(),
+        }
+        # Write to a temporary file first so a finder never reads a half written bundle
+        tempPath = self.bundle_path() + ".tmp"
+        joblib.dump(bundle, tempPath, compress=self.modelCompression)
+        osreplace(tempPath, self.bundle_path())
+        # The trained models are already in memory, so don't load them again
+        self.modelInfo = {key: value for key, value in bundle.items() if key != "Models"}
+        self.bundleTime = ospathgetmtime(self.bundle_path())
+
+    def finish_training(self):
+        """
+        Loads the models the training process saved once it is done
         """
+        self.bundleTime = None
+        try:
+            self.load_bundle()
+        except Exception:
+            self.logger.exception("Could not load the trained finder models")
         self.isLoading = False
-        for camera in self.modelsDict.keys():
-            if not ospathexists(self.modelsFolderPath):
-                osmkdir(self.modelsFolderPath)
-            joblib.dump(
-                self.modelsDict[camera],
-                open(
-                    ospathjoin(
-                        self.modelsFolderPath,
-                        camera + " " + self.desiredSpecies + ".pkl",
-                    ),
-                    "wb",
-                ),
-            )
+
+    def training_done(self, future):
+        """
+        Stops the finder from waiting on a training that failed. A successful training is finished in finish_training
+
+        :param future: The finished training of the model trainer
+        :type future: concurrent.futures.Future
+        """
+        if future.exception() is not None:
+            self.isLoading = False
+
+    def benchmark_estimators(self, estimators: list = None):
+        """
+        Compares the estimators on the training data of every camera. Reads the training data from the feature store if it hasn't been loaded, so pictures that haven't been trained on yet are left out
+
+        :param estimators: The names of the estimators to compare (Defaults to every estimator)
+        :type estimators: list[str]
+
+        :returns: The comparison for each camera with sightings, as returned by finder_estimators.benchmark_estimators
+        :rtype: dict{str: pandas.DataFrame}
+        """
+        if not hasattr(self, "trainingData"):
+            self.load_markers()
+            self.trainingData = {}
+            for camera in self.camerasDict.keys():
+                features = self.load_camera_features(camera)
+                self.trainingData.update(
+                    {
+                        camera: [
+                            features[self.fields].to_numpy(dtype=float).tolist(),
+                            features[self.desiredSpecies + " Count"]
+                            .astype(int)
+                            .tolist(),
+                        ]
+                    }
+                )
+        results = {}
+        for camera, (trainData, countData) in self.trainingData.items():
+            samples = [
+                sample for sample, count in zip(trainData, countData) if count > 0
+            ]
+            if len(samples) < 2:
+                continue
+            self.logger.info("Benchmarking estimators on " + camera)
+            results.update({camera: benchmark_estimators(samples, estimators)})
+        return results
+
+    def data_fingerprint(self):
+        """
+        Fingerprints the training data so a saved bundle can be traced back to the data it was trained on
+
+        :returns: A hash of the training data of every camera
+        :rtype: str
+        """
+        return hashlib.sha256(
+            json.dumps(self.trainingData, sort_keys=True, default=str).encode()
+        ).hexdigest()
 
     def predict(self, start_time: datetime, time_length: int, time_increment: int = 15):
         """
@@ -279,71 +919,190 @@ class AnimalFinder:
 
         :returns: A dictionary containing whether the model saw the desired species or not
         :rtype: dict
+
+        .. note::
+
+           Results are cached by the model files, the species, the time window and the forecast they were made from, so asking again for the same hunt returns right away
         """
+        self.load_markers()
+        endTime = start_time + timedelta(hours=time_length)
         self.newWeather.get_forecast(
             datetime(start_time.year, start_time.month, start_time.day),
-            datetime(start_time.year, start_time.month, start_time.day, 0)
-            + timedelta(days=1),
+            datetime(endTime.year, endTime.month, endTime.day, 0) + timedelta(days=1),
+            self.timezoneStr,
             self.weatherFields,
         )
-        for camera in self.camerasDict.keys():
-            timeData = []
-            for timeIndex in [
-                start_time + timedelta(minutes=minuteIndex)
-                for minuteIndex in range(0, time_length * 60, time_increment)
-            ]:
-                if self.firstWeekDay == "sunday":
-                    weekDay = (timeIndex.weekday() + 1) % 6
-                else:
-                    weekDay = timeIndex.weekday()
-                minuteOfDay = (
-                    timeIndex.hour * 60 + timeIndex.minute
-                )  # Get the time of the day for the image
-                numDayOfYear = timeIndex.timetuple().tm_yday
-                timeData.append(
-                    [
-                        numDayOfYear,
-                        minuteOfDay,
-                        weekDay,
-                        *self.newWeather.get_data(timeIndex, self.weatherFields),
-                    ]
-                )
-            frame = DataFrame(
-                timeData,
-                columns=self.fields,
-                index=[
-                    str(datetime.utcfromtimestamp(time))
-                    for time in range(
-                        int(start_time.timestamp()),
-                        int((start_time + timedelta(hours=time_length)).timestamp()),
-                        int(3600 / (60 / time_increment)),
-                    )
-                ],
-            )
-            self.camerasDict.update({camera: frame.transpose()})
+        cacheKey = (
+            self.model_fingerprint(),
+            self.desiredSpecies,
+            self.firstWeekDay,
+            tuple(self.weatherFields),
+            start_time.isoformat(),
+            time_length,
+            time_increment,
+            self.newWeather.forecast_fingerprint(),
+        )
+        if cacheKey in self.predictionCache:
+            self.predictionCache.move_to_end(cacheKey)
+            self.logger.info("Using cached predictions")
+            self.predDict = dict(self.predictionCache[cacheKey])
+            return self.predDict
+        timeGrid = date_range(
+            start_time,
+            periods=len(range(0, time_length * 60, time_increment)),
+            freq=str(time_increment) + "min",
+        )
+        # The weather is the same for every camera, so the features only need to be built once for the whole time grid
+        features = numpy.column_stack(
+            [
+                self.time_features(timeGrid),
+                self.newWeather.get_data_many(timeGrid, self.weatherFields).to_numpy(
+                    dtype=float
+                ),
+            ]
+        )
+        predictionIndex = timeGrid.strftime("%Y-%m-%d %H:%M:%S")
         self.predDict = {}
+        if not self.load_bundle():
+            self.logger.error("No trained models for " + self.desiredSpecies)
         for camera in self.camerasDict.keys():
-            predicitons = self.modelsDict[camera].predict(
-                [
-                    self.camerasDict[camera][time].tolist()
-                    for time in self.camerasDict[camera]
-                ]
-            )
+            if self.bundleTime is None or camera not in self.modelsDict:
+                self.logger.warning(
+                    camera + " has no trained model yet, leaving it out of the predictions"
+                )
+                continue
             predFrame = DataFrame(
-                predicitons,
+                self.modelsDict[camera].predict(features),
                 columns=["Predictions"],
-                index=[
-                    str(datetime.fromtimestamp(time))
-                    for time in range(
-                        int(start_time.timestamp()),
-                        int((start_time + timedelta(hours=time_length)).timestamp()),
-                        int(3600 / (60 / time_increment)),
-                    )
-                ],
+                index=predictionIndex,
             )
             self.predDict.update({camera: predFrame})
+        self.predictionCache.update({cacheKey: dict(self.predDict)})
+        while len(self.predictionCache) > self.predictionCacheSize:
+            self.predictionCache.popitem(last=False)
         return self.predDict
 
+    def model_fingerprint(self):
+        """
+        Identifies the saved models and the cameras they are used for, so predictions are made again whenever the models are retrained
+
+        :returns: The cameras, and the modified time and hash of the model bundle. The time and hash are None if there is no saved bundle
+        :rtype: tuple(tuple(str), float, str)
+        """
+        bundlePath = self.bundle_path()
+        if not ospathexists(bundlePath):
+            return (tuple(self.camerasDict.keys()), None, None)
+        modifiedTime = ospathgetmtime(bundlePath)
+        # Only hash the bundle again once it has been written to
+        if (bundlePath, modifiedTime) not in self.modelFileHashes:
+            self.modelFileHashes.update(
+                {(bundlePath, modifiedTime): utils.file_hash(bundlePath)}
+            )
+        return (
+            tuple(self.camerasDict.keys()),
+            modifiedTime,
+            self.modelFileHashes[(bundlePath, modifiedTime)],
+        )
+
+    def rank_stands(self, predictions: dict, marker_index=None):
+        """
+        Scores every stand from the predictions of all the cameras. Each camera's activity counts towards a stand less the further the camera is from it
+
+        :param predictions: The predictions for each camera, as returned by predict
+        :type predictions: dict{str: pandas.DataFrame}
+        :param marker_index: The index of the markers on the map. When given, the stands are read from it and each stand is only scored from the cameras a radius lookup finds near it (Defaults to None, which scores every stand from every camera in the markers file)
+        :type marker_index: markers.MarkerIndex
+
+        :returns: One row per stand ordered from the best to the worst, with the total score, the best time, the distance to the closest camera in miles and the score for every time interval
+        :rtype: pandas.DataFrame
+        """
+        if (
+            marker_index is not None
+            and len(marker_index.markers.get("Camera", [])) == 0
+        ):
+            marker_index = None  # Nothing to look up, so compare with the markers file
+        cameras = list(predictions.keys())
+        if marker_index is None:
+            stands = list(self.standsDict.keys())
+            standCoords = [self.standsDict[stand] for stand in stands]
+        else:
+            standMarkers = [
+                *marker_index.markers.get("Stand", []),
+                *marker_index.markers.get("Point of Interest", []),
+            ]
+            stands = [marker.name for marker in standMarkers]
+            standCoords = [(marker.lat, marker.long) for marker in standMarkers]
+        timeIndex = predictions[cameras[0]].index if len(cameras) > 0 else []
+        if len(cameras) == 0 or len(stands) == 0:
+            return DataFrame(
+                columns=["Score", "Best Time", "Closest Camera", *timeIndex]
+            )
+        # Inliers of the one class models are the times the camera is expected to see the species
+        activity = numpy.vstack(
+            [predictions[camera]["Predictions"].to_numpy() == 1 for camera in cameras]
+        ).astype(float)
+        if marker_index is None:
+            distances = haversine_matrix(
+                standCoords, [self.camerasDict[camera] for camera in cameras]
+            )
+            closestCameras = distances.min(axis=1)
+        else:
+            distances, closestCameras = self.nearby_camera_distances(
+                standCoords, cameras, marker_index
+            )
+        intervalScores = numpy.exp(-distances / self.rankingDistanceScale) @ activity
+        rankings = DataFrame(intervalScores, index=stands, columns=timeIndex)
+        rankings.insert(0, "Closest Camera", closestCameras)
+        rankings.insert(
+            0, "Best Time", [timeIndex[index] for index in intervalScores.argmax(axis=1)]
+        )
+        rankings.insert(0, "Score", intervalScores.sum(axis=1))
+        return rankings.sort_values("Score", ascending=False, kind="stable")
+
+    def nearby_camera_distances(self, stand_coords: list, cameras: list, marker_index):
+        """
+        Finds the distance from each stand to the cameras close enough to count towards it. Cameras further than rankingCutoff falloff distances are left out, since their influence is negligible
+
+        :param stand_coords: The GPS coordinates of each stand
+        :type stand_coords: list[tuple(lat, long)]
+        :param cameras: The names of the cameras with predictions
+        :type cameras: list[str]
+        :param marker_index: The index of the markers on the map
+        :type marker_index: markers.MarkerIndex
+
+        :returns: The distance in miles from each stand (rows) to each camera (columns), infinite for cameras that are too far away, and the distance from each stand to its closest camera
+        :rtype: tuple(numpy.ndarray, list[float])
+        """
+        cameraColumns = {camera: column for column, camera in enumerate(cameras)}
+        distances = numpy.full((len(stand_coords), len(cameras)), numpy.inf)
+        closestCameras = []
+        for row, coords in enumerate(stand_coords):
+            for marker, distance in marker_index.within(
+                coords, self.rankingCutoff * self.rankingDistanceScale, ["Camera"]
+            ):
+                if marker.name in cameraColumns:
+                    distances[row, cameraColumns[marker.name]] = distance
+            closestCameras.append(marker_index.nearest(coords, 1, ["Camera"])[0][1])
+        return distances, closestCameras
+
+    def time_features(self, times):
+        """
+        Builds the day of year, minute of day and weekday features for many times at once
+
+        :param times: The times to build the features for
+        :type times: pandas.DatetimeIndex
+
+        :returns: One row of [day of year, minute of day, weekday] per time
+        :rtype: numpy.ndarray
+        """
+        if self.firstWeekDay == "sunday":
+            weekDays = (times.weekday + 1) % 6
+        else:
+            weekDays = times.weekday
+        return numpy.column_stack(
+            [times.dayofyear, times.hour * 60 + times.minute, weekDays]
+        )
+
     def dms2dd(self, dmsr):
         """
         Converts a degree:minute:second GPS coordinate to a decimal coordinate
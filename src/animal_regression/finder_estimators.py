@@ -0,0 +1,212 @@
+from sklearn.svm import OneClassSVM
+from sklearn.linear_model import SGDOneClassSVM
+from sklearn.kernel_approximation import Nystroem
+from sklearn.ensemble import IsolationForest
+from sklearn.neighbors import KernelDensity
+from sklearn.preprocessing import RobustScaler
+from sklearn.pipeline import make_pipeline
+from sklearn.base import BaseEstimator
+from time import perf_counter
+from pandas import DataFrame
+import numpy
+
+
+class DensityThresholdModel(BaseEstimator):
+    """
+    One class model that calls a point an inlier when the kernel density of the training samples around it is high enough
+
+    :param bandwidth: The bandwidth of the gaussian kernel, in scaled feature units (Defaults to 0.5)
+    :type bandwidth: float
+    :param contamination: The fraction of training samples that fall below the density threshold (Defaults to 0.1)
+    :type contamination: float
+    :param rtol: The relative error allowed in the density, larger values predict faster (Defaults to 1e-3)
+    :type rtol: float
+    """
+
+    def __init__(
+        self, bandwidth: float = 0.5, contamination: float = 0.1, rtol: float = 1e-3
+    ):
+        self.bandwidth = bandwidth
+        self.contamination = contamination
+        self.rtol = rtol
+
+    def fit(self, samples, y=None):
+        """
+        Fits the density to the samples and picks the inlier threshold
+
+        :param samples: The feature rows to fit on
+        :type samples: list[list[float]]
+        :param y: Unused, kept for the sklearn api
+
+        :returns: This model
+        :rtype: DensityThresholdModel
+        """
+        self.density_ = KernelDensity(bandwidth=self.bandwidth, rtol=self.rtol).fit(
+            samples
+        )
+        self.threshold_ = numpy.quantile(
+            self.density_.score_samples(samples), self.contamination
+        )
+        return self
+
+    def predict(self, samples):
+        """
+        Predicts whether each sample is an inlier
+
+        :param samples: The feature rows to predict on
+        :type samples: list[list[float]]
+
+        :returns: 1 for inliers and -1 for outliers, like the other one class models
+        :rtype: numpy.ndarray
+        """
+        return numpy.where(
+            self.density_.score_samples(samples) >= self.threshold_, 1, -1
+        )
+
+
+def make_one_class_svm():
+    """
+    Makes the original OneClassSVM model. Exact, but fitting grows quickly with the number of samples
+
+    :returns: The untrained model
+    :rtype: sklearn.pipeline.Pipeline
+    """
+    return make_pipeline(RobustScaler(), OneClassSVM())
+
+
+def make_sgd_one_class_svm():
+    """
+    Makes a linear one class SVM on an approximation of the OneClassSVM kernel. Fits in linear time
+
+    :returns: The untrained model
+    :rtype: sklearn.pipeline.Pipeline
+    """
+    return make_pipeline(
+        RobustScaler(),
+        Nystroem(n_components=300, random_state=0),
+        SGDOneClassSVM(random_state=0),
+    )
+
+
+def make_isolation_forest():
+    """
+    Makes an isolation forest model. Fits and predicts quickly on large cameras
+
+    :returns: The untrained model
+    :rtype: sklearn.pipeline.Pipeline
+    """
+    return make_pipeline(RobustScaler(), IsolationForest(random_state=0))
+
+
+def make_kernel_density():
+    """
+    Makes a kernel density model that calls the densest areas of the samples inliers
+
+    :returns: The untrained model
+    :rtype: sklearn.pipeline.Pipeline
+    """
+    return make_pipeline(RobustScaler(), DensityThresholdModel())
+
+
+# Every model the finder can use for a camera, by the name saved in the property's settings
+finderEstimators = {
+    "OneClassSVM": make_one_class_svm,
+    "SGDOneClassSVM": make_sgd_one_class_svm,
+    "IsolationForest": make_isolation_forest,
+    "KernelDensity": make_kernel_density,
+}
+
+
+def make_estimator(name: str):
+    """
+    Makes a new untrained model for a camera
+
+    :param name: The name of the estimator, one of the keys of finderEstimators
+    :type name: str
+
+    :returns: The untrained model
+    :rtype: sklearn.pipeline.Pipeline
+
+    :raises ValueError: If there is no estimator with the name given
+    """
+    if name not in finderEstimators:
+        raise ValueError(
+            "Unknown finder estimator "
+            + str(name)
+            + ", choose from "
+            + ", ".join(finderEstimators.keys())
+        )
+    return finderEstimators[name]()
+
+
+def benchmark_estimators(
+    samples: list,
+    estimators: list = None,
+    baseline: str = "OneClassSVM",
+    holdout_fraction: float = 0.2,
+    seed: int = 0,
+):
+    """
+    Compares how long each estimator takes to fit and predict on a camera's samples, and how often it agrees with the baseline model on data it hasn't seen
+
+    :param samples: The feature rows of the times the camera saw the desired species
+    :type samples: list[list[float]]
+    :param estimators: The names of the estimators to compare (Defaults to every estimator)
+    :type estimators: list[str]
+    :param baseline: The name of the estimator to compare the predictions against (Defaults to OneClassSVM)
+    :type baseline: str
+    :param holdout_fraction: The fraction of the samples kept out of training to check the predictions on (Defaults to 0.2)
+    :type holdout_fraction: float
+    :param seed: The seed for splitting the samples and making the random check points (Defaults to 0)
+    :type seed: int
+
+    :returns: One row per estimator with the fit time in seconds, the predict time per sample in milliseconds and the fraction of check points where it agrees with the baseline
+    :rtype: pandas.DataFrame
+
+    .. note::
+
+       The check points are the held out samples plus as many random points spread across the range of the samples, so both inliers and outliers are compared
+    """
+    if estimators is None:
+        estimators = list(finderEstimators.keys())
+    generator = numpy.random.default_rng(seed)
+    samples = numpy.asarray(samples, dtype=float)
+    order = generator.permutation(len(samples))
+    holdoutCount = max(1, int(len(samples) * holdout_fraction))
+    trainSamples = samples[order[holdoutCount:]]
+    checkSamples = numpy.vstack(
+        [
+            samples[order[:holdoutCount]],
+            generator.uniform(
+                samples.min(axis=0),
+                samples.max(axis=0),
+                size=(holdoutCount, samples.shape[1]),
+            ),
+        ]
+    )
+
+    results = {}
+    predictions = {}
+    for name in dict.fromkeys([baseline, *estimators]):
+        model = make_estimator(name)
+        fitStart = perf_counter()
+        model.fit(trainSamples)
+        fitTime = perf_counter() - fitStart
+        predictStart = perf_counter()
+        predictions[name] = model.predict(checkSamples)
+        predictTime = (perf_counter() - predictStart) / len(checkSamples) * 1000
+        results.update(
+            {
+                name: {
+                    "Fit Time (s)": fitTime,
+                    "Predict Time (ms/sample)": predictTime,
+                }
+            }
+        )
+    for name in results.keys():
+        results[name]["Agreement"] = float(
+            numpy.mean(predictions[name] == predictions[baseline])
+        )
+    return DataFrame.from_dict(
+        {name: results[name] for name in estimators}, orient="index"
+    )
@@ -1,12 +1,170 @@
 from tkinter.filedialog import askopenfilenames
-from shutil import copy2 as shutilcopy2
-from exif import Image as exifimage
 from os.path import join as ospathjoin
-from os import rename as osrename
+from os.path import dirname as ospathdirname
+from os.path import splitext as ospathsplitext
+from os.path import basename as ospathbasename
+from os import replace as osreplace
+from os import remove as osremove
+from os import open as osopen
+from os import close as osclose
+from os import O_CREAT, O_EXCL, O_WRONLY
 from tkinter import messagebox
-from PIL import Image
+from tkinter import IntVar
+from ttkbootstrap import Toplevel, Label, Progressbar
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from animal_detector.animal_detector import HuntingAnimalDetector
+from animal_detector.animal_detector import decode_image
 from dialogs.infobox import InfoBox
+import queue
+import hashlib
+import utils
+
+importDetector = None  # The detector each import worker loads once and reuses
+
+
+def init_import_worker(cache_path: str, backend: str, detector=None):
+    """
+    Gets the animal detector ready once when an import worker starts
+
+    :param cache_path: The path to the detection cache the workers share
+    :type cache_path: str
+    :param backend: The runtime the detector should use
+    :type backend: str
+    :param detector: An already loaded detector to use instead of loading a new one. Only works for workers in the same process (Defaults to None)
+    :type detector: animal_detector.animal_detector.HuntingAnimalDetector
+    """
+    global importDetector
+    if detector is not None:
+        importDetector = detector
+    else:
+        importDetector = HuntingAnimalDetector(
+            None, cache_path=cache_path, backend=backend
+        )
+
+
+def claim_image_name(
+    images_folder: str, date_time: str, extension: str, image_data: bytes
+):
+    """
+    Reserves a file name in a camera's folder for a picture, from the time it was taken. Pictures taken in the same second, like burst shots, get a number added so none of them are overwritten
+
+    :param images_folder: The folder of the camera the picture goes in
+    :type images_folder: str
+    :param date_time: The EXIF time the picture was taken ("YYYY:MM:DD HH:MM:SS")
+    :type date_time: str
+    :param extension: The extension of the picture file, with the dot
+    :type extension: str
+    :param image_data: The picture as it will be saved, to recognize a picture that was already imported
+    :type image_data: bytes
+
+    :returns: The name of the picture in the folder, and whether it was newly reserved (False if the same picture is already there)
+    :rtype: tuple(str, bool)
+    """
+    baseName = date_time.replace(" ", "_").replace(":", "_")
+    number = 0
+    while True:
+        imageName = baseName + ("" if number == 0 else "_" + str(number)) + extension
+        imagePath = ospathjoin(images_folder, imageName)
+        try:
+            # Only creates the file if it doesn't exist yet, so parallel import workers can't reserve the same name
+            osclose(osopen(imagePath, O_CREAT | O_EXCL | O_WRONLY))
+            return imageName, True
+        except FileExistsError:
+            with open(imagePath, "rb") as existingFile:
+                if existingFile.read() == image_data:
+                    return imageName, False
+            number += 1
+
+
+def import_image_chunk(
+    file_paths: list,
+    images_folder: str,
+    latitude: tuple,
+    longitude: tuple,
+    confidence_threshold: float,
+):
+    """
+    Imports a chunk of pictures into a camera inside an import worker. Each picture is read and decoded once. Pictures without any animals are skipped, the rest are resized, stamped with the camera's location and written once under the time they were taken
+
+    :param file_paths: The paths to the pictures to import
+    :type file_paths: list[str]
+    :param images_folder: The folder of the camera to put the pictures in
+    :type images_folder: str
+    :param latitude: The latitude of the camera in degrees, minutes, seconds and the hemisphere
+    :type latitude: tuple(float, float, float, str)
+    :param longitude: The longitude of the camera in degrees, minutes, seconds and the hemisphere
+    :type longitude: tuple(float, float, float, str)
+    :param confidence_threshold: The threshold for saying there is an animal in the picture
+    :type confidence_threshold: float
+
+    :returns: For each picture, the name it was saved as (None if it was skipped) and the error if it failed (None if it didn't)
+    :rtype: list[tuple(str, str or None, str or None)]
+    """
+    results = []
+    decodedImages = {}
+    imageHashes = {}
+    for filePath in file_paths:
+        try:
+            with open(filePath, "rb") as imageFile:
+                imageData = imageFile.read()
+            imageHashes.update({filePath: hashlib.sha256(imageData).hexdigest()})
+            # Decode once at the detector's resolution, the same pixels are detected on and saved
+            decodedImages.update(
+                {
+                    filePath: decode_image(
+                        BytesIO(imageData), importDetector.imageSize
+                    )
+                }
+            )
+        except Exception as e:
+            results.append((filePath, None, str(e)))
+    detections = importDetector.detect_animals_images(
+        list(decodedImages.values()),
+        [imageHashes[filePath] for filePath in decodedImages.keys()],
+        confidence_threshold,
+    )
+    for (filePath, image), classes in zip(decodedImages.items(), detections):
+        if not classes:  # Nothing was detected, so the picture doesn't contain any information we want
+            results.append((filePath, None, None))
+            continue
+        try:
+            exif = image.getexif()
+            # Resize the image down to 640x640 pixels to match the animal detector better since that is what it is expecting
+            image = image.resize((640, 640), resample=1)
+            dateTime = exif[0x0132]  # DateTime
+            exif.get_ifd(0x8769)[0x9003] = dateTime  # DateTimeOriginal
+            gps = exif.get_ifd(0x8825)
+            gps.update(
+                {
+                    1: latitude[3],  # GPSLatitudeRef
+                    2: tuple(float(value) for value in latitude[0:3]),
+                    3: longitude[3],  # GPSLongitudeRef
+                    4: tuple(float(value) for value in longitude[0:3]),
+                }
+            )
+            imageData = BytesIO()
+            image.save(imageData, "JPEG", exif=exif)
+            imageData = imageData.getvalue()
+            imageName, reserved = claim_image_name(
+                images_folder, dateTime, ospathsplitext(filePath)[1], imageData
+            )
+            if reserved:
+                imagePath = ospathjoin(images_folder, imageName)
+                try:
+                    # Write to a temporary name first so a half written picture is never used
+                    tempPath = imagePath + ".importing"
+                    with open(tempPath, "wb") as tempFile:
+                        tempFile.write(imageData)
+                    osreplace(tempPath, imagePath)
+                except Exception:
+                    osremove(imagePath)  # Give the reserved name back
+                    raise
+            results.append((filePath, imageName, None))
+        except Exception as e:
+            results.append((filePath, None, str(e)))
+    return results
 
 
 class AddMarkerImagesDialog:
@@ -17,10 +175,20 @@ class AddMarkerImagesDialog:
     :type root: ttkbootstrap.Window, ttkbootstrap.Frame, tkinter.Tk, tkinter.Frame
     :param marker: The marker we want to add images to
     :type marker: markers.Marker
+    :param detector_backend: The runtime the animal detector should use ("torch", "onnx" or "openvino") (Defaults to "torch")
+    :type detector_backend: str
+    :param import_workers: The number of processes to import the pictures with. 1 imports them on a background thread of this process (Defaults to 1)
+    :type import_workers: int
     """
 
-    def __init__(self, root, marker):
+    def __init__(self, root, marker, detector_backend="torch", import_workers=1):
         self.root = root
+        self.logger = utils.setup_logger("AddMarkerImages", "Add Marker Images.log")
+        self.marker = marker
+        self.detectorBackend = detector_backend
+        self.importWorkers = import_workers
+        self.importChunkSize = 16  # Pictures handed to a worker at a time, small enough to keep the progress bar moving
+        self.detectorThreshold = 0.4
         self.files = list(
             askopenfilenames(
                 filetypes=(("JPEG", ".jpg"), ("PNG", ".png"), ("GIF", ".gif"))
@@ -30,36 +198,165 @@ class AddMarkerImagesDialog:
             not self.files
         ):  # If the list is empty, happens when the user presses the cancel button
             return
-        self.remove_blank_images(self.files)
-        try:
-            convertedLat = self.dd2dms(marker.lat)
-            convertedLong = self.dd2dms(marker.long, False)
-            for file in self.files:
-                shutilcopy2(file, marker.imagesPath)
-                imagePath = ospathjoin(marker.imagesPath, file.split("/")[-1])
-                self.resize_image(imagePath)
-                # Update exif data
-                image = exifimage(imagePath)
-                image.datetime_original = image.datetime
-                image.gps_latitude = convertedLat[0:3]
-                image.gps_latitude_ref = convertedLat[3]
-                image.gps_longitude = convertedLong[0:3]
-                image.gps_longitude_ref = convertedLong[3]
-                with open(imagePath, "wb") as outfile:
-                    outfile.write(image.get_file())
-                extension = imagePath.split(".")[-1]
-                osrename(
-                    imagePath,
-                    str(image.datetime.replace(" ", "_").replace(":", "_"))
-                    + "."
-                    + extension,
-                )
+        self.cachePath = ospathjoin(
+            ospathdirname(ospathdirname(marker.imagesPath)), "db", "detections.db"
+        )
+        self.infoBox = None
+        self.detector = HuntingAnimalDetector(
+            self.root,
+            wait_while_training=True,
+            cache_path=self.cachePath,
+            backend=self.detectorBackend,
+        )
+        if not self.detector.ready.done():
+            self.infoBox = InfoBox(
+                self.root,
+                "Training Started",
+                "Please wait until training has finished and images have been uploaded",
+            )
+        # Carry on with the import on the Tk thread once the detector can be used, without blocking the app while it trains
+        self.detector.ready.add_done_callback(
+            lambda future: self.root.after_idle(self.detector_ready, future)
+        )
 
-        except Exception as e:
-            print(e)
-            messagebox.showerror("Failed", "Failed to copy over pictures")
+    def detector_ready(self, future):
+        """
+        Starts the import once the animal detector is ready
+
+        :param future: The detector's ready future
+        :type future: concurrent.futures.Future
+        """
+        if self.infoBox is not None:
+            self.infoBox.close_info_box()
+        if future.exception() is not None:
+            messagebox.showerror(
+                "Failed", "The animal detector isn't ready, no pictures were copied over"
+            )
+            return
+        self.start_import()
+
+    def start_import(self):
+        """
+        Sends the pictures through the import workers in chunks and shows the progress of the import
+        """
+        convertedLat = self.dd2dms(self.marker.lat)
+        convertedLong = self.dd2dms(self.marker.long, False)
+        if self.importWorkers > 1:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.importWorkers,
+                initializer=init_import_worker,
+                initargs=(self.cachePath, self.detectorBackend),
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=1,
+                initializer=init_import_worker,
+                initargs=(self.cachePath, self.detectorBackend, self.detector),
+            )
+        # Finished chunks are passed back to the Tk thread through the queue
+        self.progressQueue = queue.Queue()
+        self.chunkFiles = {}
+        for chunkStart in range(0, len(self.files), self.importChunkSize):
+            chunk = self.files[chunkStart : chunkStart + self.importChunkSize]
+            future = self.executor.submit(
+                import_image_chunk,
+                chunk,
+                self.marker.imagesPath,
+                convertedLat,
+                convertedLong,
+                self.detectorThreshold,
+            )
+            self.chunkFiles.update({future: chunk})
+            future.add_done_callback(self.progressQueue.put)
+        self.importedCount = 0
+        self.skippedCount = 0
+        self.failedFiles = []
+
+        self.top = Toplevel(self.root)
+        self.top.title("Importing Pictures")
+        self.top.geometry("300x60")
+        self.progressCount = IntVar(self.top, value=0)
+        self.progressLabel = Label(
+            self.top,
+            text="Importing " + str(len(self.files)) + " pictures...",
+            anchor="center",
+        )
+        self.progressbar = Progressbar(
+            self.top,
+            variable=self.progressCount,
+            mode="determinate",
+            maximum=len(self.files),
+        )
+        self.progressLabel.pack(fill="both", expand=True)
+        self.progressbar.pack(fill="both", expand=True)
+        self.top.after(100, self.update_progress_bar)
+
+    def update_progress_bar(self):
+        """
+        Updates the progress bar with any chunks the workers have finished, and reports the results once every picture is done
+        """
+        while True:
+            try:
+                future = self.progressQueue.get_nowait()
+            except queue.Empty:
+                break
+            chunk = self.chunkFiles.pop(future)
+            try:
+                chunkResults = future.result()
+            except Exception as e:
+                chunkResults = [(filePath, None, str(e)) for filePath in chunk]
+            for filePath, imageName, error in chunkResults:
+                if error is not None:
+                    self.failedFiles.append((filePath, error))
+                elif imageName is None:
+                    self.skippedCount += 1
+                else:
+                    self.importedCount += 1
+        self.progressCount.set(
+            self.importedCount + self.skippedCount + len(self.failedFiles)
+        )
+        if len(self.chunkFiles) > 0:
+            self.top.after(100, self.update_progress_bar)
             return
-        messagebox.showinfo("Success", "Successfully copied over the images")
+
+        self.executor.shutdown(wait=False)
+        self.top.destroy()
+        self.logger.info(
+            "Imported "
+            + str(self.importedCount)
+            + " pictures into "
+            + self.marker.name
+            + ", skipped "
+            + str(self.skippedCount)
+        )
+        if len(self.failedFiles) > 0:
+            for filePath, error in self.failedFiles:
+                self.logger.error("Failed to import " + filePath + ": " + error)
+            shownFiles = [
+                ospathbasename(filePath) for filePath, error in self.failedFiles[:10]
+            ]
+            if len(self.failedFiles) > len(shownFiles):
+                shownFiles.append(
+                    "and " + str(len(self.failedFiles) - len(shownFiles)) + " more"
+                )
+            messagebox.showerror(
+                "Failed",
+                "Failed to copy over "
+                + str(len(self.failedFiles))
+                + " pictures, "
+                + str(self.importedCount)
+                + " were copied over\n\n"
+                + "\n".join(shownFiles),
+            )
+            return
+        messagebox.showinfo(
+            "Success",
+            "Successfully copied over "
+            + str(self.importedCount)
+            + " images, skipped "
+            + str(self.skippedCount)
+            + " without any animals",
+        )
 
     def dd2dms(self, dd, is_lat=True):
         """
@@ -83,36 +380,3 @@ class AddMarkerImagesDialog:
             return (degrees, minutes, seconds, "W")
         elif not is_lat and not negative:
             return (degrees, minutes, seconds, "E")
-
-    def resize_image(self, file_path):
-        """
-        Resizes the image down to 640x640 pixels to match the animal detector better since that is what it is expecting
-
-        :param file_path: The path to the file to resize
-        :type file_path: str
-        """
-        image = Image.open(file_path)
-        image = image.resize((640, 640), resample=1)
-        exif = image.info["exif"]
-        image.save(file_path, "JPEG", exif=exif)
-
-    def remove_blank_images(self, file_list):
-        """
-        Remove images that don't contain any animals
-        """
-        detector = HuntingAnimalDetector(self.root, wait_while_training=True)
-        infoBox = InfoBox(
-            self.root,
-            "Training Started",
-            "Please wait until training has finished and images have been uploaded",
-        )
-        while detector.isLoading:
-            pass
-        infoBox.close_info_box()
-
-        # Look through all the images and find any animals, if we don't we don't keep that image
-        for index, file in enumerate(file_list):
-            if detector.detect_animals(file, 0.4) is []:
-                file_list.pop(
-                    index
-                )  # If there is nothing detected, remove it from the list to import in since it doesn't contain any information we want
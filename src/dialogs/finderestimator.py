@@ -0,0 +1,80 @@
+from dialogs.templatedialog import DialogTemplate
+from ttkbootstrap import Label, Combobox
+from ttkbootstrap.tableview import Tableview
+
+
+class FinderEstimatorDialog(DialogTemplate):
+    """
+    Class to show how the animal finder models compare on a property and let the user pick the one to use for it
+
+    :param main_window: The window to show this dialog in front of
+    :type main_window: :type root_window: ttkbootstrap.Window, ttkbootstrap.Frame, tkinter.Tk, tkinter.Frame
+    :param comparison: The average comparison of each model across the cameras, one row per model as returned by finder_estimators.benchmark_estimators
+    :type comparison: pandas.DataFrame
+    :param current_estimator: The model the property uses now
+    :type current_estimator: str
+    """
+
+    def __init__(self, main_window, comparison, current_estimator: str):
+        super().__init__(main_window, False)
+        self.top.title("Finder Models")
+        columnData = ["Model", "Fit Time (s)", "Predict (ms/sample)", "Agreement (%)"]
+        rowData = [
+            [
+                name,
+                round(float(row["Fit Time (s)"]), 2),
+                round(float(row["Predict Time (ms/sample)"]), 3),
+                round(float(row["Agreement"]) * 100),
+            ]
+            for name, row in comparison.iterrows()
+        ]
+        table = Tableview(
+            self.widgetFrame, coldata=columnData, rowdata=rowData, autofit=True
+        )
+        estimatorLabel = Label(
+            self.widgetFrame, text="Model for this property", anchor="center"
+        )
+        self.estimatorBox = Combobox(
+            self.widgetFrame,
+            values=list(comparison.index),
+            state="readonly",
+            justify="center",
+        )
+        self.estimatorBox.set(current_estimator)
+        table.pack(fill="both", expand=True)
+        estimatorLabel.pack(fill="x")
+        self.estimatorBox.pack(fill="x")
+        self.top.update_idletasks()
+        self.top.geometry(
+            str(table.winfo_reqwidth())
+            + "x"
+            + str(
+                int(
+                    (
+                        table.winfo_reqheight()
+                        + estimatorLabel.winfo_reqheight()
+                        + self.estimatorBox.winfo_reqheight()
+                    )
+                    / (1 - self.relativeButtonHeight)
+                )
+            )
+        )
+        self.pack_frames(
+            {
+                self.widgetFrame: [1, 1 - self.relativeButtonHeight, 0, 0],
+                self.buttonFrame: [
+                    1,
+                    self.relativeButtonHeight,
+                    0,
+                    1 - self.relativeButtonHeight,
+                ],
+            }
+        )
+        self.show()
+
+    def on_okay(self, event=None):
+        """
+        Called when the okay button is pushed
+        """
+        self.result = self.estimatorBox.get()
+        self.close_dialog()
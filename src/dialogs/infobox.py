@@ -17,8 +17,8 @@ class InfoBox:
         self.messageBox = Toplevel(main_window)
         self.messageBox.geometry("250x25")
         self.messageBox.title(title)
-        infoLabel = Label(self.messageBox, text=message, anchor="center")
-        infoLabel.pack(fill="both", expand=True)
+        self.infoLabel = Label(self.messageBox, text=message, anchor="center")
+        self.infoLabel.pack(fill="both", expand=True)
         self.messageBox.withdraw()
         self.messageBox.update()  # Make sure you do this after packing everything in to make sure the heights and widths are correct
         position = (
@@ -39,6 +39,19 @@ class InfoBox:
         self.messageBox.deiconify()
         self.messageBox.update()
 
+    def set_message(self, message: str):
+        """
+        Changes the message shown to the user, growing the box downwards to fit it. Used for showing progress
+
+        :param message: The new message to show the user
+        :type message: str
+        """
+        self.infoLabel.configure(text=message, wraplength=240)
+        self.messageBox.update_idletasks()
+        self.messageBox.geometry(
+            "250x" + str(max(25, self.infoLabel.winfo_reqheight()))
+        )
+
     def close_info_box(self):
         """
         Closes the dialog box (You must call this or the info box will never go away)
@@ -1,6 +1,6 @@
 from dialogs.templatedialog import DialogTemplate
-from ttkbootstrap import Frame, Button, Label, Entry
-from tkinter import StringVar
+from ttkbootstrap import Label
+from ttkbootstrap.tableview import Tableview
 
 
 class AnimalFinderResults(DialogTemplate):
@@ -11,81 +11,62 @@ class AnimalFinderResults(DialogTemplate):
     :type main_window: :type root_window: ttkbootstrap.Window, ttkbootstrap.Frame, tkinter.Tk, tkinter.Frame
     :param species: The species the user is trying to hunt
     :type species: str
-    :param best_distance: The distance the stand is from the best camera location
-    :type best_distance: float
-    :param best_location: The best stand to go to during the time selected
-    :type best_location: str
-    :param best_time: The time at which the most deer were seen
-    :type best_time: str
+    :param stand_rankings: Every stand ordered from best to worst, as returned by AnimalFinder.rank_stands
+    :type stand_rankings: pandas.DataFrame
+    :param units: The units to show the distances in ("Imperial" or "Metric")
+    :type units: str
     """
 
     def __init__(
         self,
         main_window,
         species: str,
-        best_distance: float,
-        best_location: str,
-        best_time: str = "",
+        stand_rankings,
         units: str = "Imperial",
     ):
         super().__init__(main_window, False, True)
-        #Determine the unit to add to the best distance
+        # Determine the unit to show the distances in, the rankings are in miles
         if units == "Imperial":
             self.distanceUnit = "yds"
+            distanceConversion = 1760
         else:
             self.distanceUnit = "m"
-        # Entry Variables
-        speciesOutputVar = StringVar()
-        locationOutputVar = StringVar()
-        timeOutputVar = StringVar()
-        distanceOutputVar = StringVar()
-        # Widgets
+            distanceConversion = 1609.344
         self.top.title("Finder Results")
-        self.top.geometry("200x100")
-        # Buttons
-        buttonFrame = Frame(self.top)
-        exitButton = Button(buttonFrame, text="Close", command=self.close_dialog)
-        # Labels
-        labelsFrame = Frame(self.widgetFrame)
-        speciesLabel = Label(labelsFrame, text="Species to hunt")
-        locationLabel = Label(labelsFrame, text="Closest location")
-        timeLabel = Label(labelsFrame, text="Best time")
-        distanceLabel = Label(labelsFrame, text="Distance")
-        # Output Boxes
-        outputBoxFrame = Frame(self.widgetFrame)
-        speciesOutputBox = Entry(
-            outputBoxFrame, state="disabled", textvariable=speciesOutputVar
+        speciesLabel = Label(
+            self.widgetFrame, text="Best stands to hunt " + species, anchor="center"
         )
-        locationOutputBox = Entry(
-            outputBoxFrame, state="disabled", textvariable=locationOutputVar
+        columnData = [
+            "Rank",
+            "Stand",
+            "Score",
+            "Best Time",
+            "Closest Camera (" + self.distanceUnit + ")",
+        ]
+        rowData = [
+            [
+                rank + 1,
+                stand,
+                round(float(row["Score"]), 2),
+                row["Best Time"],
+                int(row["Closest Camera"] * distanceConversion),
+            ]
+            for rank, (stand, row) in enumerate(stand_rankings.iterrows())
+        ]
+        table = Tableview(
+            self.widgetFrame,
+            coldata=columnData,
+            rowdata=rowData,
+            autofit=True,
         )
-        timeOutputBox = Entry(
-            outputBoxFrame, state="disabled", textvariable=timeOutputVar
+        speciesLabel.pack(fill="x")
+        table.pack(fill="both", expand=True)
+        self.top.update_idletasks()
+        self.top.minsize(table.winfo_reqwidth(), 100)
+        self.top.geometry(
+            str(table.winfo_reqwidth())
+            + "x"
+            + str(table.winfo_reqheight() + speciesLabel.winfo_reqheight())
         )
-        distanceOutputBox = Entry(
-            outputBoxFrame, state="disabled", textvariable=distanceOutputVar
-        )
-        # Set variables
-        speciesOutputVar.set(species)
-        locationOutputVar.set(best_location)
-        timeOutputVar.set(best_time)
-        distanceOutputVar.set(best_distance + " " + self.distanceUnit)
-        # Pack widget frames
-        # Labels
-        speciesLabel.pack(fill="both", expand=True)
-        locationLabel.pack(fill="both", expand=True)
-        distanceLabel.pack(fill="both", expand=True)
-        timeLabel.pack(fill="both", expand=True)
-        # OutputBoxes
-        speciesOutputBox.pack(fill="both", expand=True)
-        locationOutputBox.pack(fill="both", expand=True)
-        distanceOutputBox.pack(fill="both", expand=True)
-        timeOutputBox.pack(fill="both", expand=True)
-        # Pack button frame
-        exitButton.pack(fill="both", expand=True)
-        # Frame packing and positioning
-        labelsFrame.pack(fill="both", expand=True, side="left")
-        outputBoxFrame.pack(fill="both", expand=True, side="left")
-        self.widgetFrame.pack(fill="both", expand=True)
-        buttonFrame.pack(fill="both", expand=True)
+        self.pack_frames({self.widgetFrame: [1, 1, 0, 0]})
         self.show(no_wait=True)
@@ -2,7 +2,7 @@ from dialogs.templatedialog import DialogTemplate
 from dialogs.hunt import HuntDialog
 from ttkbootstrap.tableview import Tableview
 from weather.weather import Weather
-from timezonefinder.timezonefinder import TimezoneFinder
+from utils import property_timezone
 from pandas import DataFrame
 import datetime
 
@@ -25,6 +25,8 @@ class WeatherReportDialog(DialogTemplate):
     :type time_interval: int (Units of minutes)
     :param units: The units to get the weather in ("Imperial" or "Metric")
     :type units: str
+    :param timezone_path: The file the property's timezone is saved in (Defaults to None)
+    :type timezone_path: str
 
     .. todo::
 
@@ -40,6 +42,7 @@ class WeatherReportDialog(DialogTemplate):
         hunt_length: int = None,
         time_interval: int = 15,
         units: str = "Imperial",
+        timezone_path: str = None,
     ):
         super().__init__(main_window, False, True)
         self.location = location
@@ -70,22 +73,24 @@ class WeatherReportDialog(DialogTemplate):
             datetime.datetime(self.date.year, self.date.month, self.date.day),
             datetime.datetime(self.date.year, self.date.month, self.date.day, 0)
             + datetime.timedelta(days=1),
-            TimezoneFinder().timezone_at(lat=self.location[0], lng=self.location[1]),
+            property_timezone(self.location, timezone_path),
             self.weatherFields,
         )
 
         # Create the data structure to hold all the data
-        data = []
-        for timeIndex in [
+        reportTimes = [
             self.date + datetime.timedelta(minutes=minuteIndex)
             for minuteIndex in range(0, self.timeLength * 60, time_interval)
-        ]:
-            data.append(
-                [
-                    timeIndex.strftime("%H:%M"),
-                    *self.futureWeather.get_data(timeIndex, self.weatherFields),
-                ]
+        ]
+        reportWeather = self.futureWeather.get_data_many(
+            reportTimes, self.weatherFields
+        )
+        data = [
+            [timeIndex.strftime("%H:%M"), *weatherRow]
+            for timeIndex, weatherRow in zip(
+                reportTimes, reportWeather.itertuples(index=False)
             )
+        ]
 
         # Create the dataframe to hold all the data
         self.times = [
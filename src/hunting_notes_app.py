@@ -1,7 +1,7 @@
 import utils
-import haversine
 import subprocess
 import multiprocessing
+import threading
 from os import rmdir as osrmdir
 from os import mkdir as osmkdir
 from os import listdir as oslistdir
@@ -26,7 +26,8 @@ from dialogs.hunt import HuntDialog
 from dialogs.infobox import InfoBox
 from dialogs.resultsviewer import AnimalFinderResults
 from dialogs.weatherreport import WeatherReportDialog
-from markers import Marker
+from dialogs.finderestimator import FinderEstimatorDialog
+from markers import Marker, MarkerIndex
 import webbrowser
 
 
@@ -56,7 +57,9 @@ class HuntingNotesApp:
 
         # Class Data
         self.markers = []
+        self.markerIndex = MarkerIndex()
         self.currentMarker = None
+        self.finder = None  # Kept for the whole property session so the models only load once
         self.huntDate = None
         self.huntStartTime = None
         self.huntLength = None
@@ -199,6 +202,9 @@ class HuntingNotesApp:
         self.sidebar.add_menu_button(
             "Train Animal Finder", self.train_animal_finder, "Train Models"
         )
+        self.sidebar.add_menu_button(
+            "Compare Finder Models", self.compare_finder_estimators, "Train Models"
+        )
         # Extras
         self.sidebar.add_menu_tab("Extras", tab_place_properties={"relheight": 0.1})
         self.sidebar.add_menu_button(
@@ -302,6 +308,8 @@ class HuntingNotesApp:
         """
         Loads the markers from the markers.csv file
         """
+        self.markers = []  # Any markers from the last map were destroyed along with it
+        self.markerIndex.clear()
         try:
             with open(
                 ospathjoin(self.dataDirectory, self.databaseFolder, "markers.csv")
@@ -321,6 +329,7 @@ class HuntingNotesApp:
                         if self.settings["Satellite"]:
                             newMarker.change_color(text_color="white")
                         self.markers.append(newMarker)
+                        self.markerIndex.add(newMarker)
         except FileNotFoundError:
             self.logger.info("No marker file exists, creating one")
             with open(
@@ -339,7 +348,7 @@ class HuntingNotesApp:
         if not str(type(event.widget)) == "<class 'tkinter.Canvas'>":
             return
         markerHighlighted = False
-        for marker in self.markers:
+        for marker in list(Marker.highlightedMarkers):
             if marker.justHighlighted:
                 self.currentMarker = marker
                 markerHighlighted = True
@@ -385,6 +394,7 @@ class HuntingNotesApp:
             self.database,
         )
         self.markers.append(newMarker)
+        self.markerIndex.add(newMarker)
         if markerDialog.result["markerType"] == "Camera":
             if not ospathexists(
                 ospathjoin(
@@ -540,6 +550,7 @@ class HuntingNotesApp:
         self.markers.pop(
             self.markers.index(self.currentMarker)
         )  # Remove the currently selected marker from the list
+        self.markerIndex.remove(self.currentMarker)
         self.currentMarker.destroy()  # Delete the marker from the map
         self.currentMarker = None
 
@@ -599,21 +610,17 @@ class HuntingNotesApp:
             messagebox.showerror("Not Camera", "Can only add images to a camera")
             self.logger.error("User tried to add images to a non-camera item")
             return
-        AddMarkerImagesDialog(self.root, self.currentMarker)
+        AddMarkerImagesDialog(
+            self.root,
+            self.currentMarker,
+            self.settings.get("Detector Backend", "torch"),
+            int(self.settings.get("Ingest Workers", 1)),
+        )
 
     def go_hunt(self):
         """
         Called when the user wants to determine the best place to go on a certain day
         """
-        self.infoBox = InfoBox(
-            self.root, "Loading Model Data", "Please wait while model library loads"
-        )
-        from animal_regression.animal_finder import (
-            AnimalFinder,
-        )  # Dynamically import the library, used to get faster startup time until you try to go hunting
-
-        self.infoBox.close_info_box()
-
         self.huntDialog = HuntDialog(
             self.root,
             self.huntDate,
@@ -629,43 +636,56 @@ class HuntingNotesApp:
         self.huntStartTime = self.huntDialog.result["Start Time"]
         self.huntLength = self.huntDialog.result["Time Length"]
 
-        self.infoBox = InfoBox(
-            self.root, "Loading Model Data", "Please wait while model data loads"
-        )
-        self.finder = AnimalFinder(
-            self.root,
-            self.dataDirectory,
-            self.database,
-            self.weatherFields,
-            self.homePosition,
-            self.speciesClasses,
-            self.desiredSpecies,
-        )
+        if not self.finder_matches():
+            self.infoBox = InfoBox(
+                self.root, "Loading Model Data", "Please wait while model data loads"
+            )
+            self.finder = self.make_finder(progress_cb=self.show_training_progress)
+            if not self.finder.isLoading:
+                self.infoBox.close_info_box()
+        elif not self.finder.isLoading and len(self.finder.stale_cameras()) > 0:
+            # Pictures were added since the finder was made, so only the cameras they went to need updating
+            self.infoBox = InfoBox(
+                self.root, "Updating Model", "Please wait while new pictures are added"
+            )
+            self.finder.start_training()
 
         if self.finder.isLoading:
-            self.finderLoaderTimer = utils.RepeatTimer(
-                1, self.check_finder_loaded, ["Repeating"]
+            # Carry on with the prediction on the Tk thread the moment training ends
+            self.finder.trainer.done.add_done_callback(
+                lambda future: self.root.after_idle(self.finder_loaded, future)
             )
-            self.finderLoaderTimer.start()  # Create and start a timer to check when the finder has fully loaded
         else:
             self.predict_and_process()  # If the finder model was already trained, jump straight to the prediction step
 
-    def check_finder_loaded(self):
+    def show_training_progress(self, message: dict):
         """
-        Checks to see if the finder model is loading(training) (Allows non-blocking execution of the main display)
+        Shows the latest training progress of the finder in place of the loading message
+
+        :param message: The progress update sent from the training process
+        :type message: dict
+        """
+        self.infoBox.set_message(utils.format_progress(message, "\n"))
+
+    def finder_loaded(self, future):
+        """
+        Predicts with the finder once it has finished training (Allows non-blocking execution of the main display)
+
+        :param future: The finished training of the finder's model trainer
+        :type future: concurrent.futures.Future
         """
-        if self.finder.isLoading:
-            return
-        self.finderLoaderTimer.cancel()
         self.infoBox.close_info_box()
+        if future.exception() is not None:
+            messagebox.showerror(
+                "Failed", "The animal finder could not be trained, no prediction was made"
+            )
+            return
         self.predict_and_process()
 
     def predict_and_process(self):
         """
-        Predicts which camera sees the mostactivity during the time period selected. Displays the results in a dialog.
+        Predicts how active every camera is during the time period selected and ranks every stand from it. Displays the results in a dialog.
         """
-        bestSum = -10000000000
-        bestCamera = None
         self.infoBox = InfoBox(
             self.root,
             "Predicting",
@@ -676,47 +696,15 @@ class HuntingNotesApp:
             self.huntDialog.result["Time Length"],
             self.timeInterval,
         )
-        for camera in predictions.keys():
-            tempSum = sum(predictions[camera]["Predictions"])
-            if tempSum > bestSum:
-                bestSum = tempSum
-                bestCamera = camera
-        for marker in self.markers:
-            if marker.name == bestCamera:
-                bestCameraCoords = (marker.lat, marker.long)
-        bestLocation, bestDistance = self.find_best_stand(bestCameraCoords)
+        self.standRankings = self.finder.rank_stands(predictions, self.markerIndex)
         self.infoBox.close_info_box()
         AnimalFinderResults(
             self.root,
             self.desiredSpecies,
-            bestDistance,
-            bestLocation,
+            self.standRankings,
             self.units,
         )
 
-    def find_best_stand(self, best_camera_coords: tuple = (0, 0)):
-        """
-        Finds the best stand based on pure distance from the most active camera during the time period selected
-
-        :param best_camera_coords: The GPS coordinates of the most active camera
-        :type best_camera_coords: tuple(lat, long)
-
-        :returns: The name of the best stand location based on distance and the distance to that standfrom the camera
-        :rtype: tuple(stand name, distance)
-        """
-        bestDistance = 100000000
-        bestLocation = None
-        for marker in self.markers:
-            if marker.type == "Stand" or marker.type == "Point of Interest":
-                distance = haversine.haversine(
-                    best_camera_coords, (marker.lat, marker.long), unit="mi"
-                )
-                if distance < bestDistance:
-                    bestDistance = distance
-                    bestLocation = marker.name
-
-        return (bestLocation, int(bestDistance * 1760))  # return the distance in yds
-
     def train_animal_detector(self):
         """
         Trains the animal detector model to find different species in an image
@@ -730,24 +718,40 @@ class HuntingNotesApp:
         from animal_detector.animal_detector import HuntingAnimalDetector
 
         self.detectorInfoBox.close_info_box()
-        HuntingAnimalDetector(self.root, True)
+        HuntingAnimalDetector(
+            self.root, True, backend=self.settings.get("Detector Backend", "torch")
+        )
 
     def train_animal_finder(self):
         """
         Trains the animal finder model used to locate animals on the property
         """
-        self.finderInfoBox = InfoBox(
-            self.root, "Training Animal Finder", "Please wait while finder data loads"
-        )
+        #finder_train_dialog = AnimalFinderTrainingDialog(self.root)
+        #if finder_train_dialog.result is None:
+        #    return
+        if not self.finder_matches():
+            # Kept as the session's finder so Go Hunt doesn't train a second one
+            self.finder = self.make_finder()
+        if not self.finder.isLoading:
+            # Refits every camera, stored picture features aren't extracted again
+            self.finder.start_training(full=True)
+
+    def make_finder(self, estimator: str = None, **kwargs):
+        """
+        Makes an animal finder for the current property and species with the settings the user chose
+
+        :param estimator: The model to use for the cameras of the property, saved as the property's choice (Defaults to None, which uses the property's saved choice)
+        :type estimator: str
+        :param kwargs: Any other keyword arguments to pass to the finder
+
+        :returns: The new finder, which may be training in the background
+        :rtype: animal_regression.animal_finder.AnimalFinder
+        """
         from animal_regression.animal_finder import (
             AnimalFinder,
         )  # Dynamically import the library, used to get faster startup time until you try to go hunting
 
-        self.finderInfoBox.close_info_box()
-        #finder_train_dialog = AnimalFinderTrainingDialog(self.root)
-        #if finder_train_dialog.result is None:
-        #    return
-        AnimalFinder(
+        return AnimalFinder(
             self.root,
             self.dataDirectory,
             self.database,
@@ -755,8 +759,98 @@ class HuntingNotesApp:
             self.homePosition,
             self.speciesClasses,
             self.desiredSpecies,
+            ingest_workers=int(self.settings.get("Ingest Workers", 1)),
+            detector_backend=self.settings.get("Detector Backend", "torch"),
+            train_workers=int(self.settings.get("Train Workers", 1)),
+            estimator=estimator,
+            **kwargs,
+        )
+
+    def finder_matches(self):
+        """
+        Checks if the finder already made can be used for the current property and species
+
+        :returns: Whether the finder can be reused
+        :rtype: bool
+        """
+        return not (
+            self.finder is None
+            or self.finder.database != self.database
+            or self.finder.desiredSpecies != self.desiredSpecies
         )
 
+    def compare_finder_estimators(self):
+        """
+        Compares how fast each model the finder can use fits the cameras of this property, and how closely it agrees with the original model. One can then be picked for the property
+        """
+        if not self.finder_matches():
+            self.finder = self.make_finder()
+        if self.finder.isLoading:
+            messagebox.showinfo(
+                "Finder Training",
+                "The animal finder is training, compare the models once it is done",
+            )
+            return
+        self.infoBox = InfoBox(
+            self.root,
+            "Comparing Models",
+            "Please wait while every finder model is tested on the cameras",
+        )
+        # Fitting every model on every camera takes a while, so keep it off the Tk loop
+        threading.Thread(
+            target=self.benchmark_in_background, args=(self.finder,), daemon=True
+        ).start()
+
+    def benchmark_in_background(self, finder):
+        """
+        Runs the finder model comparison and shows the results on the Tk loop. Runs on its own thread and never touches any widgets
+
+        :param finder: The finder to compare the models of
+        :type finder: animal_regression.animal_finder.AnimalFinder
+        """
+        try:
+            results = finder.benchmark_estimators()
+        except Exception as e:
+            self.logger.exception("Failed to compare the finder models")
+            results = e
+        self.root.after_idle(self.show_estimator_comparison, results)
+
+    def show_estimator_comparison(self, results):
+        """
+        Shows the average of the finder model comparison across every camera, and switches the property to the model the user picks
+
+        :param results: The comparison for each camera as returned by AnimalFinder.benchmark_estimators, or the error if it failed
+        :type results: dict{str: pandas.DataFrame} or Exception
+        """
+        self.infoBox.close_info_box()
+        if isinstance(results, Exception):
+            messagebox.showerror("Failed", "Could not compare the finder models")
+            return
+        if len(results) == 0:
+            messagebox.showinfo(
+                "No Data",
+                "No camera has enough sightings to compare the finder models on",
+            )
+            return
+        average = sum(results.values()) / len(results)
+        estimatorDialog = FinderEstimatorDialog(
+            self.root, average, self.finder.estimator
+        )
+        if (
+            estimatorDialog.result is None
+            or estimatorDialog.result == self.finder.estimator
+        ):
+            return
+        # The property's choice is saved by the finder, which retrains every camera with the new model
+        self.finder = self.make_finder(estimator=estimatorDialog.result)
+        if self.finder.isLoading:
+            messagebox.showinfo(
+                "Retraining",
+                "The animal finder is retraining with "
+                + estimatorDialog.result
+                + ", you may keep using the app while it trains",
+            )
+
     def change_property(self):
         """
         Changes the property to another one, calls up the dialog
@@ -765,6 +859,7 @@ class HuntingNotesApp:
         if changePropertyDialog.result is None:
             return
         self.database = changePropertyDialog.result
+        self.finder = None
         self.notesPath = ospathjoin(self.dataDirectory, self.database, "notes")
         self.imagesPath = ospathjoin(self.dataDirectory, self.database, "pictures")
         self.databaseFolder = ospathjoin(self.dataDirectory, self.database, "db")
@@ -789,6 +884,7 @@ class HuntingNotesApp:
             self.huntLength,
             self.timeInterval,
             self.units,
+            ospathjoin(self.databaseFolder, "timezone.txt"),
         )
 
     def open_help(self):
@@ -1,4 +1,6 @@
 from os.path import join as ospathjoin
+import numpy
+
 
 class Marker:
     """
@@ -20,6 +22,8 @@ class Marker:
     :type database: str
     """
 
+    highlightedMarkers = set()  # Markers that are highlighted or were just clicked, so a click only needs to check these
+
     def __init__(
         self, map_widget, lat, long, name, marker_type, data_directory, database
     ):
@@ -85,6 +89,7 @@ class Marker:
                 text_color=self.textColor
             )
             self.justHighlighted = True
+            Marker.highlightedMarkers.add(self)
 
     def unhighlight(self, force=False):
         """
@@ -102,6 +107,7 @@ class Marker:
                 self.justHighlighted = False
             self.make_marker(text_color=self.textColor)
             self.isHighlighted = False
+            Marker.highlightedMarkers.discard(self)
 
     def change_color(self, **kwargs):
         """
@@ -118,4 +124,130 @@ class Marker:
         """
         Deletes the tkintermapview marker from the map
         """
+        Marker.highlightedMarkers.discard(self)
         self.marker.delete()
+
+
+class MarkerIndex:
+    """
+    Spatial index of the markers on the map for fast nearest and radius lookups. Keeps a haversine BallTree for each marker type
+
+    .. note::
+
+       The trees are only rebuilt the next time a lookup is made after markers are added or removed, so loading a property with many markers stays fast
+    """
+
+    earthRadius = 3958.8  # Miles
+
+    def __init__(self):
+        self.markers = {}
+        self.trees = {}
+
+    def add(self, marker):
+        """
+        Adds a marker to the index
+
+        :param marker: The marker to add
+        :type marker: markers.Marker
+        """
+        self.markers.setdefault(marker.type, []).append(marker)
+        self.trees.pop(marker.type, None)
+
+    def remove(self, marker):
+        """
+        Removes a marker from the index
+
+        :param marker: The marker to remove
+        :type marker: markers.Marker
+        """
+        if marker in self.markers.get(marker.type, []):
+            self.markers[marker.type].remove(marker)
+            self.trees.pop(marker.type, None)
+
+    def clear(self):
+        """
+        Removes every marker from the index
+        """
+        self.markers = {}
+        self.trees = {}
+
+    def get_tree(self, marker_type: str):
+        """
+        Gets the tree for a marker type, building it if markers have changed since the last lookup
+
+        :param marker_type: The type of marker to get the tree for
+        :type marker_type: str
+
+        :returns: The tree of marker positions in radians, or None if there are no markers of that type
+        :rtype: sklearn.neighbors.BallTree or None
+        """
+        if len(self.markers.get(marker_type, [])) == 0:
+            return None
+        if marker_type not in self.trees:
+            from sklearn.neighbors import BallTree  # Only loaded when it is first needed to keep startup fast
+
+            self.trees[marker_type] = BallTree(
+                numpy.radians(
+                    [[marker.lat, marker.long] for marker in self.markers[marker_type]]
+                ),
+                metric="haversine",
+            )
+        return self.trees[marker_type]
+
+    def nearest(self, coords: tuple, k: int = 1, marker_types: list = None):
+        """
+        Finds the closest markers to a location
+
+        :param coords: The GPS coordinates to search around
+        :type coords: tuple(lat, long)
+        :param k: The number of markers to find (Defaults to 1)
+        :type k: int
+        :param marker_types: The types of markers to search (Defaults to None, which searches every type)
+        :type marker_types: list[str] or None
+
+        :returns: The closest markers and their distance in miles, closest first
+        :rtype: list[tuple(markers.Marker, float)]
+        """
+        found = []
+        for markerType in self.markers.keys() if marker_types is None else marker_types:
+            tree = self.get_tree(markerType)
+            if tree is None:
+                continue
+            distances, indices = tree.query(
+                numpy.radians([coords]), k=min(k, len(self.markers[markerType]))
+            )
+            found.extend(
+                (self.markers[markerType][index], distance * self.earthRadius)
+                for distance, index in zip(distances[0], indices[0])
+            )
+        return sorted(found, key=lambda item: item[1])[:k]
+
+    def within(self, coords: tuple, radius: float, marker_types: list = None):
+        """
+        Finds every marker within a distance of a location
+
+        :param coords: The GPS coordinates to search around
+        :type coords: tuple(lat, long)
+        :param radius: The distance to search in miles
+        :type radius: float
+        :param marker_types: The types of markers to search (Defaults to None, which searches every type)
+        :type marker_types: list[str] or None
+
+        :returns: The markers in range and their distance in miles, closest first
+        :rtype: list[tuple(markers.Marker, float)]
+        """
+        found = []
+        for markerType in self.markers.keys() if marker_types is None else marker_types:
+            tree = self.get_tree(markerType)
+            if tree is None:
+                continue
+            indices, distances = tree.query_radius(
+                numpy.radians([coords]),
+                r=radius / self.earthRadius,
+                return_distance=True,
+            )
+            found.extend(
+                (self.markers[markerType][index], distance * self.earthRadius)
+                for distance, index in zip(distances[0], indices[0])
+            )
+        return sorted(found, key=lambda item: item[1])
@@ -1,12 +1,19 @@
 import logging
+import hashlib
 import multiprocessing
+import multiprocessing.connection
 import threading
 import sys
 import ttkbootstrap.validation as ttkval
+from concurrent.futures import Future
 from os.path import dirname as ospathdirname
 from os.path import abspath as ospathabspath
 from os.path import join as ospathjoin
+from os.path import exists as ospathexists
 
+timezoneFinder = None  # Created the first time a timezone needs to be looked up since it loads a large dataset
+timezoneFinderLock = threading.Lock()
+progressConnection = None  # The pipe back to the app, only set inside a training process
 
 @ttkval.validator
 def validate_coord(event=None):
@@ -85,14 +92,106 @@ def setup_logger(name, filename, level=logging.INFO):
     return logger
 
 
-class RepeatTimer(threading.Timer):
+def file_hash(file_path, chunk_size=1048576):
     """
-    Runs the input function when the class is instantiated, Waits the interval time, and calls it again until cancelled
+    Hashes the contents of a file so it can be used as a key for cached results
+
+    :param file_path: The path to the file to hash
+    :type file_path: str
+    :param chunk_size: The number of bytes to read at a time (Defaults to 1MB)
+    :type chunk_size: int
+
+    :returns: The hex digest of the file contents
+    :rtype: str
+    """
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def property_timezone(coordinates, timezone_path=None):
+    """
+    Gets the name of the timezone at a location. The result is saved to a file so a property only ever has to be looked up once
+
+    :param coordinates: The GPS coordinates to get the timezone of
+    :type coordinates: tuple(lat, long)
+    :param timezone_path: The file to save the timezone in (Usually timezone.txt in the property's db folder). Nothing is saved if this is None (Defaults to None)
+    :type timezone_path: str
+
+    :returns: The name of the timezone, like "America/New_York"
+    :rtype: str
+    """
+    global timezoneFinder
+    if timezone_path is not None and ospathexists(timezone_path):
+        with open(timezone_path, "r") as timezoneFile:
+            timezoneName = timezoneFile.read().strip()
+        if timezoneName != "":
+            return timezoneName
+    with timezoneFinderLock:
+        if timezoneFinder is None:
+            from timezonefinder.timezonefinder import TimezoneFinder
+
+            timezoneFinder = TimezoneFinder()
+        timezoneName = timezoneFinder.timezone_at(
+            lat=coordinates[0], lng=coordinates[1]
+        )
+    if timezone_path is not None and timezoneName is not None:
+        with open(timezone_path, "w") as timezoneFile:
+            timezoneFile.write(timezoneName)
+    return timezoneName
+
+
+def report_progress(message: dict):
+    """
+    Sends a progress update from inside a training process back to the model trainer that started it. Does nothing outside of a training process
+
+    :param message: The progress to report, keyed by what each value is (E.g. {"Epoch": 3, "Epochs": 50})
+    :type message: dict
+    """
+    global progressConnection
+    if progressConnection is None:
+        return
+    try:
+        progressConnection.send(message)
+    except OSError:  # The app stopped listening, keep training anyways
+        progressConnection = None
+
+
+def format_progress(message: dict, separator: str = ", "):
+    """
+    Turns a progress update into text to show the user or log
+
+    :param message: The progress update, as sent by report_progress
+    :type message: dict
+    :param separator: The text to put between each value (Defaults to ", ")
+    :type separator: str
+
+    :returns: Each key and value of the update, with decimals rounded
+    :rtype: str
+    """
+    return separator.join(
+        key + ": " + (str(round(value, 3)) if isinstance(value, float) else str(value))
+        for key, value in message.items()
+        if value is not None
+    )
+
+
+def run_training(training_cb, training_kwargs: dict, progress_connection):
     """
+    Runs the training callback inside the training process, with report_progress sending to the model trainer
 
-    def run(self):
-        while not self.finished.wait(self.interval):
-            self.function()
+    :param training_cb: Callback that trains the model
+    :type training_cb: Callable
+    :param training_kwargs: The keyword arguments to pass to the training callback
+    :type training_kwargs: dict
+    :param progress_connection: The sending end of the progress pipe
+    :type progress_connection: multiprocessing.connection.Connection
+    """
+    global progressConnection
+    progressConnection = progress_connection
+    training_cb(**training_kwargs)
 
 
 class ModelTrainer:
@@ -111,10 +210,22 @@ class ModelTrainer:
     :type training_cb: Callable
     :param post_train_cb: Callback that runs after the model has finished training. Usually to save the model to a directory
     :type post_train_cb: Callable
-    
+    :param root: The Tk window the post train and progress callbacks should run on, since they may update widgets. Without one they run on the waiter thread (Defaults to None)
+    :type root: ttkbootstrap.Window, ttkbootstrap.Frame, tkinter.Tk, tkinter.Frame
+    :param progress_cb: Callback that runs with every progress update the training process sends with report_progress (Defaults to None, where updates are only logged)
+    :type progress_cb: Callable
+
     ..note::
-    
-        This module requires that all modules that use this to train themselves have a parameter called isLoading to ensure they are fully trained before using them
+
+        This module requires that all modules that use this to train themselves have a future called ready, finished once they are fully trained, to ensure they are ready before using them
+
+    .. note::
+
+       The done future is finished once training and the post train callback are over, or with an exception if anything failed. Use done.add_done_callback to react to it instead of polling
+
+    .. note::
+
+       When there are required modules, the training data is gathered on a background thread once they are ready so a slow load doesn't freeze the app. Only the post train and progress callbacks are sent to the Tk loop
     """
 
     def __init__(
@@ -126,6 +237,8 @@ class ModelTrainer:
         training_kwarg_cb=None,
         training_cb=None,
         post_train_cb=None,
+        root=None,
+        progress_cb=None,
     ):
         self.logger = logger
         self.name = name
@@ -134,10 +247,26 @@ class ModelTrainer:
         self.trainingKwargCallback = training_kwarg_cb
         self.trainingCallback = training_cb
         self.postTrainingCallback = post_train_cb
-        self.doneTimer = RepeatTimer(1, self.check_training_done, ["Repeating"])
-        self.loadedTimer = RepeatTimer(1, self.check_all_modules_loaded, ["Repeating"])
+        self.root = root
+        self.progressCallback = progress_cb
+        self.latestProgress = None
+        self.done = Future()
+        self.modulesLock = threading.Lock()
         self.load_required_modules()
 
+    def run_on_ui(self, callback, *args):
+        """
+        Runs a UI facing callback on the Tk loop as soon as it is idle, so widgets are only ever touched from the Tk thread
+
+        :param callback: The function to run
+        :type callback: Callable
+        :param args: The arguments to pass to the function
+        """
+        if self.root is not None:
+            self.root.after_idle(callback, *args)
+        else:
+            callback(*args)
+
     def load_required_modules(self):
         """
         Calls the callback to load any required modules
@@ -154,10 +283,37 @@ class ModelTrainer:
                 self.moduleList is None
             ):  # If the callback returns none, then there was an error trying to load required modules
                 self.post_training(True)
-            self.loadedTimer.start()
+                return
+            self.modulesLeft = len(self.moduleList)
+            if self.modulesLeft == 0:
+                self._start_gathering_thread()
+                return
+            for module in self.moduleList:
+                module.ready.add_done_callback(self.module_loaded)
         else:  # If no modules are needed, then we can just skip to gathering data
             if self.gather_training_data() is not None:
-                self.postTrainingCallback(failed=True)
+                self.post_training(True)
+
+    def _start_gathering_thread(self):
+        """
+        Gathers the training data and starts training on a background thread, so loading the data doesn't block the app
+        """
+        self.gatherThread = threading.Thread(
+            target=self.gather_in_background, name=self.name + " Loader", daemon=True
+        )
+        self.gatherThread.start()
+
+    def gather_in_background(self):
+        """
+        Gathers the training data and starts training. Runs on its own thread, so the data callback must not touch any widgets
+        """
+        try:
+            result = self.gather_training_data()
+        except Exception as e:
+            self.logger.exception("Failed to gather the training data")
+            result = e
+        if result is not None:
+            self.post_training(True)
 
     def gather_training_data(self):
         """
@@ -186,40 +342,86 @@ class ModelTrainer:
 
     def _start_training_thread(self):
         """
-        Starts a thread to train the model to not block any other operations
+        Starts a process to train the model to not block any other operations, and a thread that listens to it until it exits
         """
+        self.progressReader, progressWriter = multiprocessing.Pipe(duplex=False)
         self.trainThread = multiprocessing.Process(
-            target=self.trainingCallback, kwargs=self.trainKwargs
+            target=run_training,
+            args=(self.trainingCallback, self.trainKwargs, progressWriter),
         )
         self.trainThread.name = self.name
         self.logger.info("Starting training thread")
         self.trainThread.start()
-        self.doneTimer.start()
+        progressWriter.close()  # Only the training process writes, so the pipe ends when it exits
+        self.waitThread = threading.Thread(
+            target=self.wait_for_training, name=self.name + " Waiter", daemon=True
+        )
+        self.waitThread.start()
 
-    def check_training_done(self):
+    def wait_for_training(self):
         """
-        Checks to see if the training thread has finished its job
+        Passes progress updates to the Tk loop as they arrive until the training process exits, then hands over the result. Runs on its own thread and never touches any widgets
+        """
+        progressOpen = True
+        while True:
+            waitList = [self.trainThread.sentinel]
+            if progressOpen:
+                waitList.append(self.progressReader)
+            ready = multiprocessing.connection.wait(waitList)
+            if self.progressReader not in ready:  # The process exited and every update was read
+                break
+            try:
+                self.run_on_ui(self.progress_received, self.progressReader.recv())
+            except EOFError:
+                progressOpen = False
+        self.progressReader.close()
+        self.training_ended()
+
+    def progress_received(self, message: dict):
+        """
+        Logs a progress update from the training process and passes it on
+
+        :param message: The progress update, as sent by report_progress
+        :type message: dict
         """
-        if not self.trainThread.is_alive():  # Training thread has completed
-            self.logger.info("Model training ended")
-            self.doneTimer.cancel()
-            self.post_training()
+        self.latestProgress = message
+        self.logger.info(self.name + " progress: " + format_progress(message))
+        if self.progressCallback is not None:
+            self.progressCallback(message)
 
-    def check_all_modules_loaded(self):
+    def training_ended(self):
         """
-        Checks to see if all the required models are loaded properly. I.E, any other modules that require training are done
+        Finishes up once the training process has exited. Runs on the waiter thread, only the post train callback is sent to the Tk loop
         """
-        if (
-            self.moduleList is None
-        ):  # If no submodules are required, then there are no modules to wait on
+        self.trainThread.join()
+        self.logger.info("Model training ended")
+        if self.trainThread.exitcode != 0:
+            self.logger.error(
+                "Training process exited with code " + str(self.trainThread.exitcode)
+            )
+            self.post_training(True)
             return
+        self.run_on_ui(self.post_training)
 
-        for module in self.moduleList:
-            if module.isLoading:
+    def module_loaded(self, future):
+        """
+        Counts down the required modules as they finish loading, and starts gathering the training data once they are all ready. Runs on whichever thread finished the module
+
+        :param future: The ready future of the module that finished
+        :type future: concurrent.futures.Future
+        """
+        with self.modulesLock:
+            if self.done.done():  # Another module already failed
+                return
+            if future.exception() is not None:
+                self.logger.error(future.exception())
+                self.post_training(True)
+                return
+            self.modulesLeft -= 1
+            if self.modulesLeft > 0:
                 return
         self.logger.info("All required modules loaded")
-        self.loadedTimer.cancel()
-        self.gather_training_data()
+        self._start_gathering_thread()
 
     def post_training(self, failed: bool = False):
         """
@@ -230,11 +432,19 @@ class ModelTrainer:
         """
         if not failed:
             self.logger.info("Calling post train function")
-            result = self.postTrainingCallback()
+            try:
+                result = self.postTrainingCallback()
+            except Exception as e:
+                self.logger.exception("Post train function failed")
+                self.done.set_exception(e)
+                return
             self.trainThread.close()
             if result is not None:
                 self.logger.error(result)
+                self.done.set_exception(Exception(result))
                 return
             self.logger.info("Done training")
+            self.done.set_result(None)
         else:
             self.logger.error("Failed to train the system")
+            self.done.set_exception(Exception("Failed to train " + self.name))
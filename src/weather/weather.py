@@ -1,14 +1,24 @@
 from datetime import datetime
 from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from time import sleep as timesleep
+import threading
+import hashlib
 import openmeteo_requests
 from pandas import DataFrame
+from pandas import DatetimeIndex
+from pandas import to_datetime as pandastodatetime
+from pandas import Series
+from pandas import date_range
 from pandas import concat as pandasconcat
 from joblib import dump as joblibdump
 from joblib import load as joblibload
 from utils import resource_path
 from os.path import exists as ospathexists
-from os import mkdir as osmkdir
+from os.path import join as ospathjoin
+from os import makedirs as osmakedirs
 import pandas
+import numpy
 
 
 class Weather:
@@ -61,6 +71,9 @@ class Weather:
         "Precipitation Probability": "precipitation_probability",
         "Snowfall": "snowfall",
     }
+    apiClient = None  # Shared by every Weather object so the connections to Open-Meteo get reused
+    apiClientLock = threading.Lock()
+    forecastRefreshes = {}  # When each cached field's forecast hours were last fetched, shared by every Weather object
 
     """
     Class to handle getting the future forecast of the weather
@@ -71,14 +84,30 @@ class Weather:
     :type timestep: str
     :param units: The type of units to use (Metric or Imperial)
     :type units: str
+    :param archive_url: The url of the historical weather endpoint (Defaults to the Open-Meteo archive api)
+    :type archive_url: str
+    :param forecast_url: The url of the forecast endpoint (Defaults to the Open-Meteo forecast api)
+    :type forecast_url: str
     """
 
     def __init__(
-        self, coordinates: tuple, timestep: str = "1hr", units: str = "Imperial"
+        self,
+        coordinates: tuple,
+        timestep: str = "1hr",
+        units: str = "Imperial",
+        archive_url: str = "https://archive-api.open-meteo.com/v1/archive",
+        forecast_url: str = "https://api.open-meteo.com/v1/forecast",
     ):
         self.coordinates = coordinates
         self.timestep = timestep
         self.units = units
+        self.archiveUrl = archive_url
+        self.forecastUrl = forecast_url
+        self.chunkFrequency = "MS"  # Split long historical requests at the start of each month
+        self.maxConcurrentRequests = 4
+        self.maxRetries = 3
+        self.retryBackoff = 1  # Seconds to wait before the first retry, doubled every retry after
+        self.forecastRefreshMinutes = 60  # Open-Meteo updates its forecast models about once an hour
 
     def get_forecast(
         self, start_time: datetime, end_time: datetime, timezone: str, fields: list
@@ -102,123 +131,258 @@ class Weather:
             )  # Round the end time up to the next whole hour if we are getting past data
         self.fieldsList = fields
         self.timeZone = timezone
-        oldest_date_to_get = self.load_data(start_time)
-        if oldest_date_to_get < self.forecastEnd:
-            if oldest_date_to_get > datetime.strptime(self.hourlyData.index[0],"%Y-%m-%d %H:%M:%S"):
-                lastGotWeatherData = self.get_weather_data(oldest_date_to_get, self.forecastEnd)
-                self.hourlyData = pandasconcat([self.hourlyData, lastGotWeatherData])
-            else:
-                self.hourlyData = self.get_weather_data(oldest_date_to_get, datetime.strptime(self.hourlyData.index[-1],"%Y-%m-%d %H:%M:%S"))
-            #pandas.set_option("display.max_rows", 500)
-            #print(self.hourlyData)
-            self.save_data()
-        
-              
-    def get_weather_data(self, start_time, end_time):
+        requiredHours = date_range(
+            start_time.replace(minute=0, second=0, microsecond=0),
+            self.forecastEnd,
+            freq="h",
+        )
+        # Forecasts get revised, so any hour that is not in the archive yet is fetched again
+        refreshAfter = datetime.now().replace(
+            minute=0, second=0, microsecond=0
+        ) - timedelta(days=5)
+        fieldData = {field: self.load_field(field) for field in fields}
+        missingFields = {}
+        for field in fields:
+            staleHours = requiredHours >= refreshAfter
+            lastRefresh = self.forecastRefreshes.get((self.cache_folder(), field))
+            refreshWindow = timedelta(minutes=self.forecastRefreshMinutes)
+            if lastRefresh is not None and datetime.now() - lastRefresh[0] < refreshWindow:
+                # Hours fetched recently are still the latest forecast revision
+                staleHours &= ~(
+                    (requiredHours >= lastRefresh[1]) & (requiredHours <= lastRefresh[2])
+                )
+            missingHours = requiredHours[
+                ~requiredHours.isin(fieldData[field].index) | staleHours
+            ]
+            for intervalStart, intervalEnd in self.hour_intervals(missingHours):
+                missingFields.setdefault((intervalStart, intervalEnd), []).append(field)
+
+        for (intervalStart, intervalEnd), intervalFields in missingFields.items():
+            try:
+                fetchedData = self.get_weather_data(
+                    intervalStart, intervalEnd, intervalFields
+                )
+            except Exception:
+                # Without internet, fall back to the saved data as long as we have every hour
+                if all(
+                    date_range(intervalStart, intervalEnd, freq="h")
+                    .isin(fieldData[field].index)
+                    .all()
+                    for field in intervalFields
+                ):
+                    continue
+                raise
+            for field in intervalFields:
+                fieldData[field] = pandasconcat([fieldData[field], fetchedData[field]])
+                fieldData[field] = fieldData[field][
+                    ~fieldData[field].index.duplicated(keep="last")
+                ].sort_index()
+                if intervalEnd >= refreshAfter:
+                    self.forecastRefreshes.update(
+                        {
+                            (self.cache_folder(), field): (
+                                datetime.now(),
+                                intervalStart,
+                                intervalEnd,
+                            )
+                        }
+                    )
+        for field in set(
+            field
+            for intervalFields in missingFields.values()
+            for field in intervalFields
+        ):
+            self.save_field(field, fieldData[field])
+
+        self.hourlyData = DataFrame(
+            {
+                field: fieldData[field].loc[requiredHours[0] : requiredHours[-1]]
+                for field in fields
+            }
+        )
+
+    def forecast_fingerprint(self):
+        """
+        Fingerprints the weather data from the last call to get_forecast, so results built from it can be reused until the forecast is revised
+
+        :returns: A hash of the hourly data and the times it covers
+        :rtype: str
         """
-        Gets the weather data between the requested start and end times
+        hasher = hashlib.sha256()
+        hasher.update(",".join(self.hourlyData.columns).encode())
+        hasher.update(self.hourlyData.index.asi8.tobytes())
+        hasher.update(self.hourlyData.to_numpy(dtype=float).tobytes())
+        return hasher.hexdigest()
+
+    def hour_intervals(self, hours):
+        """
+        Groups a list of hours into runs of back to back hours
+
+        :param hours: The hours to group
+        :type hours: pandas.DatetimeIndex
+
+        :returns: The first and last hour of each run
+        :rtype: list[tuple(datetime.datetime, datetime.datetime)]
+        """
+        if len(hours) == 0:
+            return []
+        hours = hours.sort_values()
+        hourSeconds = hours.to_numpy(dtype="datetime64[s]").astype("int64")
+        runBreaks = numpy.flatnonzero(numpy.diff(hourSeconds) != 3600)
+        runStarts = [0, *(runBreaks + 1)]
+        runEnds = [*runBreaks, len(hours) - 1]
+        return [
+            (hours[runStart].to_pydatetime(), hours[runEnd].to_pydatetime())
+            for runStart, runEnd in zip(runStarts, runEnds)
+        ]
+
+    def get_weather_data(self, start_time, end_time, fields=None):
+        """
+        Gets the weather data between the requested start and end times. Long historical ranges are split into month sized chunks that are requested at the same time
         
         :param start_time: The time to start gathering data at
         :type start_time: datetime.datetime
         :param end_time: The time to stop gathering data at
         :type end_time: datetime.datetime
+        :param fields: The weather fields to get (Defaults to None, which gets the fields from the last forecast request)
+        :type fields: list[str] or None
         
-        :returns: The weather data for the given fields between the given start and end times
+        :returns: The weather data for the given fields between the given start and end times, indexed by the local time of each hour
         :rtype: pandas.DataFrame
         """
-        om = openmeteo_requests.Client()
-        apiTimeSplit = [None, None]
-        self.timeList = [
-            time
-            for time in range(
-                int(start_time.timestamp()),
-                int(end_time.timestamp()) + 1,
-                3600,  # The last value is not included in the range
-            )  # We only care about the latest whole that has passed. It is very unlikely that you would be uploading an image from
+        if fields is None:
+            fields = self.fieldsList
+        # The archive only has data up to about 5 days ago, anything newer comes from the forecast api
+        archiveEnd = datetime.now().replace(
+            minute=0, second=0, microsecond=0
+        ) - timedelta(days=5)
+        apiRequests = []
+        if start_time < archiveEnd:
+            for chunkStart, chunkEnd in self.split_time_range(
+                start_time, min(end_time, archiveEnd - timedelta(hours=1))
+            ):
+                apiRequests.append((self.archiveUrl, chunkStart, chunkEnd))
+        if end_time >= archiveEnd:
+            apiRequests.append(
+                (self.forecastUrl, max(start_time, archiveEnd), end_time)
+            )
+
+        with ThreadPoolExecutor(max_workers=self.maxConcurrentRequests) as executor:
+            apiHourlyData = list(
+                executor.map(
+                    lambda apiRequest: self.fetch_hourly_data(*apiRequest, fields),
+                    apiRequests,
+                )
+            )
+        return pandasconcat(apiHourlyData)
+
+    def split_time_range(self, start_time, end_time):
+        """
+        Splits a range of time into chunks at the chunk frequency (The start of every month by default)
+
+        :param start_time: The first hour of the range
+        :type start_time: datetime.datetime
+        :param end_time: The last hour of the range
+        :type end_time: datetime.datetime
+
+        :returns: The first and last hour of each chunk
+        :rtype: list[tuple(datetime.datetime, datetime.datetime)]
+        """
+        boundaries = [
+            boundary.to_pydatetime()
+            for boundary in date_range(
+                start_time, end_time, freq=self.chunkFrequency, normalize=True
+            )
+            if boundary > start_time
         ]
-        # Create the value at which we will split the time list
-        findValue = int(
-            (
-                datetime.now().replace(minute=0, second=0, microsecond=0)
-                - timedelta(days=5)
-            ).timestamp()
+        return list(
+            zip(
+                [start_time, *boundaries],
+                [*[boundary - timedelta(hours=1) for boundary in boundaries], end_time],
+            )
         )
-        # Try splitting the list
-        try:
-            findIndex = self.timeList.index(findValue)
-            apiTimeSplit[0] = [
-                start_time,
-                datetime.fromtimestamp(self.timeList[findIndex-1]),
-            ]
-            apiTimeSplit[1] = [
-                datetime.fromtimestamp(self.timeList[findIndex+1]),
-                end_time,
-            ]
-        except (
-            ValueError
-        ):  # If the split value is not found, then the date range is entirely in the past api or the forecast api
-            if start_time > (
-                datetime.now() - timedelta(days=5)
-            ):  # Entirely future data
-                apiTimeSplit[1] = [start_time, end_time]
-            else:  # Entirely past data
-                apiTimeSplit[0] = [start_time, end_time]
-
-        apiHourlyData = []
-        for index in range(2):
-            if apiTimeSplit[index] is None:
-                apiHourlyData.append(None)
-                continue
-            
-            params = {
-                "latitude": self.coordinates[0],
-                "longitude": self.coordinates[1],
-                "hourly": [self.weatherAttributes[field] for field in self.fieldsList],
-                "start_hour": apiTimeSplit[index][0].strftime("%Y-%m-%dT%H:%M"),
-                "end_hour": apiTimeSplit[index][1].strftime("%Y-%m-%dT%H:%M"),
-                "timezone": self.timeZone,
-            }
-            # Change the units if needed
-            if self.units == "Imperial":
-                params.update(
-                    {
-                        "temperature_unit": "fahrenheit",
-                        "wind_speed_unit": "mph",
-                        "precipitation_unit": "inch",
-                    }
-                )
 
-            if index == 0:
-                responses = om.weather_api(
-                    "https://archive-api.open-meteo.com/v1/archive", params=params
-                )
-            else:
-                responses = om.weather_api(
-                    "https://api.open-meteo.com/v1/forecast", params=params
-                )
-                
-            apiHourlyData.append(responses[0].Hourly())
-            # Append the data together (Should rework to add it to the right place right away instead of combining and removing later)
-        
-        hourlyData = [[] for item in range(len(self.fieldsList))]
-        for apiIndex in range(2):  # Go through the split times
-            if apiHourlyData[apiIndex] is None:
-                continue
-            for fieldIndex, fieldData in enumerate(
-                [
-                    apiHourlyData[apiIndex].Variables(index).ValuesAsNumpy().tolist()
-                    for index in range(0, len(self.fieldsList))
-                ]
-            ):
-                hourlyData[fieldIndex].extend(fieldData)
+    def fetch_hourly_data(self, url, start_time, end_time, fields):
+        """
+        Requests hourly data from one of the weather endpoints, retrying with a growing wait if the request fails
 
-        hourlyData = DataFrame(
-            hourlyData,
-            columns=[str(datetime.fromtimestamp(time)) for time in self.timeList],
-            index=self.fieldsList,
+        :param url: The url of the endpoint to request from
+        :type url: str
+        :param start_time: The first hour to get
+        :type start_time: datetime.datetime
+        :param end_time: The last hour to get
+        :type end_time: datetime.datetime
+        :param fields: The weather fields to get
+        :type fields: list[str]
+
+        :returns: The weather data for the given fields, indexed by the local time of each hour
+        :rtype: pandas.DataFrame
+        """
+        params = {
+            "latitude": self.coordinates[0],
+            "longitude": self.coordinates[1],
+            "hourly": [self.weatherAttributes[field] for field in fields],
+            "start_hour": start_time.strftime("%Y-%m-%dT%H:%M"),
+            "end_hour": end_time.strftime("%Y-%m-%dT%H:%M"),
+            "timezone": self.timeZone,
+        }
+        # Change the units if needed
+        if self.units == "Imperial":
+            params.update(
+                {
+                    "temperature_unit": "fahrenheit",
+                    "wind_speed_unit": "mph",
+                    "precipitation_unit": "inch",
+                }
+            )
+        for attempt in range(self.maxRetries + 1):
+            try:
+                responses = self.get_api_client().weather_api(url, params=params)
+                return self.hourly_frame(responses[0], fields)
+            except Exception:
+                if attempt == self.maxRetries:
+                    raise
+                timesleep(self.retryBackoff * 2**attempt)
+
+    @classmethod
+    def get_api_client(cls):
+        """
+        Gets the Open-Meteo client shared by every Weather object, creating it the first time it is needed
+
+        :returns: The shared client
+        :rtype: openmeteo_requests.Client
+        """
+        with cls.apiClientLock:
+            if cls.apiClient is None:
+                cls.apiClient = openmeteo_requests.Client()
+        return cls.apiClient
+
+    def hourly_frame(self, response, fields):
+        """
+        Converts the hourly data in an Open-Meteo response into a frame indexed by the local time of each hour
+
+        :param response: The response from the Open-Meteo API
+        :type response: openmeteo_sdk.WeatherApiResponse.WeatherApiResponse
+        :param fields: The weather fields that were requested, in the order they were requested
+        :type fields: list[str]
+
+        :returns: One float32 column per weather field, indexed by the local time of each hour
+        :rtype: pandas.DataFrame
+        """
+        hourly = response.Hourly()
+        # The API gives UTC timestamps, so add the offset of the requested timezone to get the local time of each hour
+        hourTimes = pandastodatetime(
+            numpy.arange(hourly.Time(), hourly.TimeEnd(), hourly.Interval())
+            + response.UtcOffsetSeconds(),
+            unit="s",
+        )
+        return DataFrame(
+            {
+                field: hourly.Variables(index).ValuesAsNumpy().astype(numpy.float32)
+                for index, field in enumerate(fields)
+            },
+            index=DatetimeIndex(hourTimes),
         )
-        hourlyData = hourlyData.transpose()
-        return hourlyData
 
     def get_data(self, date_time: datetime, attrib_list: list):
         """
@@ -239,6 +403,56 @@ class Weather:
             data  # Return the filled in list with the same order that it came in with
         )
 
+    def get_data_many(self, times, attrib_list: list):
+        """
+        Gets the weather for many times at once by interpolating every requested field in a single pass
+
+        :param times: The dates and times that you want the weather for
+        :type times: pandas.DatetimeIndex or list[datetime.datetime]
+        :param attrib_list: The list of attributes you want (i.e temperature, wind speed, rainfall, etc)
+        :type attrib_list: list[str]
+
+        :returns: One row per requested time and one column per requested attribute, rounded the same way as get_data
+        :rtype: pandas.DataFrame
+        """
+        times = DatetimeIndex(times)
+        requestedSeconds = times.to_numpy(dtype="datetime64[s]").astype("int64")
+        hourlySeconds = self.hourlyData.index.to_numpy(dtype="datetime64[s]").astype(
+            "int64"
+        )
+        data = {}
+        for item in attrib_list:
+            hourlyValues = self.hourlyData[item].to_numpy()
+            if item == "Weather Code":
+                # Weather codes can't be interpolated, so use the code from the start of the hour
+                hourPositions = numpy.clip(
+                    numpy.searchsorted(hourlySeconds, requestedSeconds, side="right")
+                    - 1,
+                    0,
+                    len(hourlySeconds) - 1,
+                )
+                data.update(
+                    {
+                        item: [
+                            self.weatherCodes[int(code)]
+                            for code in hourlyValues[hourPositions]
+                        ]
+                    }
+                )
+                continue
+            numDecimal = 3 if item == "Precipitation" else 1
+            data.update(
+                {
+                    item: numpy.round(
+                        numpy.interp(
+                            requestedSeconds, hourlySeconds, hourlyValues.astype(float)
+                        ),
+                        numDecimal,
+                    )
+                }
+            )
+        return DataFrame(data, index=times, columns=attrib_list)
+
     def __interpolate_data(self, time: datetime, attrib_type: str):
         """
         Interpolates the input time between data points we have recieved from the meteostat api
@@ -253,9 +467,11 @@ class Weather:
         """
         if attrib_type == "Weather Code":
             return self.weatherCodes[
-                self.hourlyData[attrib_type][
-                    str(datetime(time.year, time.month, time.day, time.hour))
-                ]
+                int(
+                    self.hourlyData[attrib_type][
+                        datetime(time.year, time.month, time.day, time.hour)
+                    ]
+                )
             ]
         numDecimal = (
             3 if attrib_type == "Precipitation" else 1
@@ -268,37 +484,53 @@ class Weather:
         )  # Add one hour to the previous hour for interpolation
         x1x = (nextTime - time).total_seconds()
         xx0 = (time - prevTime).total_seconds()
-        y0 = self.hourlyData[attrib_type][str(prevTime)]
-        y1 = self.hourlyData[attrib_type][str(nextTime)]
+        y0 = float(self.hourlyData[attrib_type][prevTime])
+        y1 = float(self.hourlyData[attrib_type][nextTime])
         return round(
             (y0 * x1x + y1 * xx0) / 3600, numDecimal
         )  # 3600 is the difference between x1 and x0 which is an hour
 
-    def save_data(self):
+    def cache_folder(self):
+        """
+        Gets the folder the saved weather data for this location is kept in. Coordinates are rounded to about 1km since that is close to the resolution of the weather models
+
+        :returns: The path to the folder for this location and set of units
+        :rtype: str
         """
-        Saves the returned weather data into a file for later retrieval without internet
+        return resource_path(
+            ospathjoin(
+                "Weather Data",
+                "{0:.2f}_{1:.2f}_{2}".format(
+                    self.coordinates[0], self.coordinates[1], self.units
+                ),
+            ),
+            file_name=__file__,
+        )
+
+    def save_field(self, field: str, field_data):
         """
-        if not ospathexists(resource_path("Weather Data", file_name=__file__)):
-            osmkdir(resource_path("Weather Data", file_name=__file__))
-        joblibdump(self.hourlyData, open(resource_path("Weather Data\\"+"WeatherData.pkl", file_name=__file__), "wb"))
-    
-    def load_data(self, oldest_requested_date):
+        Saves the hourly data of one weather field for this location for later retrieval without internet
+
+        :param field: The weather field being saved
+        :type field: str
+        :param field_data: The hourly values of the field
+        :type field_data: pandas.Series
         """
-        Loads any previously saved weather data
-        
-        :param oldest date: The oldest date we are trying to get weather data for
-        :type oldest_date: datetime.datetime
-        
-        :returns: The oldest date that we need to get data for
-        :rtype: datetime.datetime
+        if not ospathexists(self.cache_folder()):
+            osmakedirs(self.cache_folder())
+        joblibdump(field_data, ospathjoin(self.cache_folder(), field + ".pkl"))
+
+    def load_field(self, field: str):
+        """
+        Loads any previously saved hourly data of one weather field for this location
+
+        :param field: The weather field to load
+        :type field: str
+
+        :returns: The saved hourly values of the field, empty if nothing has been saved yet
+        :rtype: pandas.Series
         """
-        if ospathexists(resource_path("Weather Data\\"+"WeatherData.pkl", file_name=__file__)):
-            self.hourlyData = joblibload(resource_path("Weather Data\\"+"WeatherData.pkl", file_name=__file__))
-            earliestSavedDateTime = datetime.strptime(self.hourlyData.index[0],"%Y-%m-%d %H:%M:%S") #Grab first datetime stored in the file 
-            latestSavedDatetime = datetime.strptime(self.hourlyData.index[-1],"%Y-%m-%d %H:%M:%S") #Grab the last datetime saved in the file
-            if  earliestSavedDateTime <= oldest_requested_date:
-                return latestSavedDatetime + timedelta(hours=1)
-            else:
-                return oldest_requested_date #If the requested oldest date is older than the oldest date we have stored in the datafile
-        else:
-            return oldest_requested_date
\ No newline at end of file
+        fieldPath = ospathjoin(self.cache_folder(), field + ".pkl")
+        if ospathexists(fieldPath):
+            return joblibload(fieldPath)
+        return Series(index=DatetimeIndex([]), dtype=numpy.float32, name=field)